@@ -0,0 +1,195 @@
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import metrics
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away; retry_after says when trying again may succeed"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MemoryAdmissionStore:
+    """Client token buckets and provider slots for a single worker process"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.slots = {}
+        self.lock = threading.Lock()
+        self.next_sweep = 0
+
+    def take_tokens(self, client, cost, rate, burst):
+        """Spend cost tokens from the client's bucket; return 0, or seconds until there will be enough"""
+        with self.lock:
+            now = time.time()
+            tokens, updated = self.buckets.get(client, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate / 60)
+            if tokens >= cost:
+                self.buckets[client] = (tokens - cost, now)
+                wait = 0
+            else:
+                self.buckets[client] = (tokens, now)
+                wait = (cost - tokens) * 60 / rate
+            # Drop buckets that have refilled so idle clients do not pile up
+            if now >= self.next_sweep:
+                self.next_sweep = now + 60
+                full = [name for name, (left, at) in self.buckets.items()
+                        if left + (now - at) * rate / 60 >= burst]
+                for name in full:
+                    del self.buckets[name]
+            return wait
+
+    def acquire_slot(self, pool, limit, lease):
+        """Return a slot id when fewer than limit are held in the pool, else None"""
+        with self.lock:
+            now = time.time()
+            held = [slot for slot, (name, expires) in self.slots.items() if name == pool and expires > now]
+            if len(held) >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            self.slots[slot] = (pool, now + lease)
+            return slot
+
+    def release_slot(self, slot):
+        with self.lock:
+            self.slots.pop(slot, None)
+
+
+class SQLiteAdmissionStore:
+    """Client token buckets and provider slots in a SQLite file shared by every worker process
+
+    Slots are leases, so a worker that dies holding one only blocks it until
+    the lease runs out.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (client TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS slots (id TEXT PRIMARY KEY, pool TEXT NOT NULL, '
+                         'expires REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slots_pool ON slots (pool, expires)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def take_tokens(self, client, cost, rate, burst):
+        with self._connect() as conn:
+            # Take the write lock up front so the read and update are one step
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE client = ?', (client,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate / 60)
+            wait = 0 if tokens >= cost else (cost - tokens) * 60 / rate
+            if not wait:
+                tokens -= cost
+            conn.execute('INSERT OR REPLACE INTO buckets (client, tokens, updated) VALUES (?, ?, ?)',
+                         (client, tokens, now))
+            # Buckets idle long enough to be full again carry no state
+            conn.execute('DELETE FROM buckets WHERE updated < ?', (now - burst * 60 / rate,))
+            return wait
+
+    def acquire_slot(self, pool, limit, lease):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            conn.execute('DELETE FROM slots WHERE expires <= ?', (now,))
+            held = conn.execute('SELECT COUNT(*) FROM slots WHERE pool = ?', (pool,)).fetchone()[0]
+            if held >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            conn.execute('INSERT INTO slots (id, pool, expires) VALUES (?, ?, ?)', (slot, pool, now + lease))
+            return slot
+
+    def release_slot(self, slot):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM slots WHERE id = ?', (slot,))
+
+
+def create_admission_store(url):
+    """Build a store from 'memory' or 'sqlite:///path/to/file.db'"""
+    if not url or url == 'memory':
+        return MemoryAdmissionStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteAdmissionStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported admission store: {url}')
+
+
+class Admission:
+    """Per-client token buckets in front of a concurrency cap per provider
+
+    A request first pays its cost from the client's bucket, then takes a slot
+    in its provider's pool. When the pool is full it waits in a bounded
+    queue; a full queue or a wait past queue_timeout rejects it at once with
+    a retry hint, so overload turns into quick 429s instead of slow failures.
+    """
+
+    def __init__(self, store, rate=60, burst=20, limits=None, queue_size=32, queue_timeout=10.0,
+                 lease=300.0, poll_interval=0.05):
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.limits = limits or {}
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.waiting = {}
+        self.lock = threading.Lock()
+
+    def charge(self, client, cost):
+        """Spend a client's tokens or raise AdmissionRejected"""
+        if not self.rate or not cost:
+            return
+        wait = self.store.take_tokens(client, cost, self.rate, max(self.burst, cost))
+        if wait:
+            metrics.admission_rejections.inc(reason='rate')
+            raise AdmissionRejected('Too many requests from this client, slow down', wait)
+
+    def acquire(self, pool):
+        """Take a slot in a provider pool, queueing for it, and return the slot (None when unlimited)"""
+        limit = self.limits.get(pool)
+        if not limit:
+            return None
+        slot = self.store.acquire_slot(pool, limit, self.lease)
+        if slot:
+            return slot
+        with self.lock:
+            if self.waiting.get(pool, 0) >= self.queue_size:
+                metrics.admission_rejections.inc(reason='queue_full')
+                raise AdmissionRejected(f'The {pool} service is busy, try again shortly', self.queue_timeout)
+            self.waiting[pool] = self.waiting.get(pool, 0) + 1
+        start = time.monotonic()
+        try:
+            while time.monotonic() - start < self.queue_timeout:
+                # Jitter keeps queued requests from polling in lockstep
+                time.sleep(self.poll_interval * random.uniform(0.5, 1.5))
+                slot = self.store.acquire_slot(pool, limit, self.lease)
+                if slot:
+                    metrics.admission_wait_seconds.observe(time.monotonic() - start, pool=pool)
+                    return slot
+            metrics.admission_rejections.inc(reason='queue_timeout')
+            raise AdmissionRejected(f'The {pool} service is busy, try again shortly', self.queue_timeout)
+        finally:
+            with self.lock:
+                self.waiting[pool] -= 1
+
+    def release(self, slot):
+        if slot:
+            self.store.release_slot(slot)
@@ -1,188 +1,724 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Request, request, jsonify, make_response, Response, g, send_file, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 import base64
+import json
 import os
+import tempfile
 import re
-import requests
 from dotenv import load_dotenv
-from groq import Groq
 import logging
-from openai import OpenAI
-import argparse
-import pygame
+import functools
+import hmac
 import io
+import math
+import threading
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrency import RateLimiter, SingleFlight, Speculator, run_ordered, run_task, submit
+from story_parser import StoryStreamParser, parse_story, parse_story_json
+from caches import DescriptionCache, StoryCache, ImageCache, AudioCache, AssetStore
+from preprocess import IMAGE_VARIANTS, MIME_TYPES, prepare_image, image_variant, vision_profile, distinct_frames
+from jobs import JobStore, JobQueue
+from state import create_state_store, new_id
+from providers import create_providers
+import clients
+import metrics
+import time
+from resilience import CallPolicy, CircuitBreaker, CircuitOpenError, DeadlineExceeded, deadline, remaining
+from admission import Admission, AdmissionRejected, create_admission_store
+from archive import StoryArchive
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)
 load_dotenv()
 
+# Uploads up to this size stay in memory, larger ones spool to a private temp file
+upload_spool_bytes = int(os.getenv("UPLOAD_SPOOL_MB", "16")) * 1024 * 1024
+# Larger request bodies are refused with 413 before they are read
+max_upload_bytes = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+class UploadRequest(Request):
+    """Request that buffers file uploads in memory below upload_spool_bytes"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= upload_spool_bytes:
+            return io.BytesIO()
+        return tempfile.TemporaryFile('rb+')
+
+# Routes live on a blueprint so create_app can build the Flask app
+api = Blueprint('api', __name__)
+# Only the listed front ends may call the API from a browser
+cors_origins = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(',') if origin.strip()]
+
+@api.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@api.after_app_request
+def record_request(response):
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_seconds.observe(time.perf_counter() - g.request_start, route=route,
+                                        method=request.method, status=response.status_code)
+    return response
+
 # Client setup
-grok_api_key = os.getenv("GROQ_API_KEY")
+# PROVIDERS=fake swaps every provider for a local stand-in with recorded latencies. Live
+# providers import their SDKs and open connections on first use, not here
+provider_kind = os.getenv("PROVIDERS", "live")
+providers = create_providers(provider_kind,
+                             latency_scale=float(os.getenv("PROVIDER_LATENCY_SCALE", "1")))
 llava_model = 'llava-v1.5-7b-4096-preview'
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
-
-# Global variable to store the latest image description
-latest_image_description = None
-
-def encode_image(image_path):
-    """Convert image to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-def image_to_text(client1, model, base64_image, prompt):
-    """Generate description using LLAVA model"""
-    chat_completion = client1.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ],
-        model=model
-    )
-    return chat_completion.choices[0].message.content
-
-@app.route('/generate_description', methods=['POST'])
+elevenlabs_voice_id = os.getenv("ELEVENLABS_VOICE_ID", "pNInz6obpgDQGcFmaJgB")
+voice_settings = {
+    "stability": 0.5,
+    "similarity_boost": 0.8,
+    "style": 1,
+    "use_speaker_boost": False
+}
+
+# Image descriptions already produced, keyed by image bytes, model and prompt
+description_cache = DescriptionCache(
+    max_entries=int(os.getenv("DESCRIPTION_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("DESCRIPTION_CACHE_TTL", "86400")),
+    db_path=os.getenv("DESCRIPTION_CACHE_DB") or None
+)
+
+# Finished stories keyed by description, prompt template and model settings; identical
+# requests in flight at the same time share one run
+story_cache = StoryCache(
+    max_entries=int(os.getenv("STORY_CACHE_SIZE", "256")),
+    ttl=int(os.getenv("STORY_CACHE_TTL", "86400")),
+    db_path=os.getenv("STORY_CACHE_DB") or None
+)
+story_flights = SingleFlight()
+
+# Every finished story, searchable and reused for its description once the cache has let it go
+story_archive = StoryArchive(os.getenv("ARCHIVE_DB", "archive.db"),
+                             mmap_bytes=int(os.getenv("ARCHIVE_MMAP_MB", "256")) * 1024 * 1024)
+archive_page_max = int(os.getenv("ARCHIVE_PAGE_MAX", "100"))
+
+# Speculative stories: once a description is ready, write its story (and optionally the
+# first images and narration) before the client asks, under a cap on unclaimed runs
+speculate_stories = os.getenv("SPECULATE_STORIES", "false") == "true"
+speculate_images = int(os.getenv("SPECULATE_IMAGES", "1"))
+speculate_tts = os.getenv("SPECULATE_TTS", "false") == "true"
+speculator = Speculator(
+    max_pending=int(os.getenv("SPECULATE_MAX_PENDING", "8")),
+    ttl=float(os.getenv("SPECULATE_TTL", "120")),
+    max_workers=int(os.getenv("SPECULATE_WORKERS", "2"))
+)
+# Identical image prompts and narration segments in flight at once share one provider call
+image_flights = SingleFlight()
+segment_flights = SingleFlight()
+
+# Generated images on disk, keyed by normalized prompt, size, n and model
+image_model = os.getenv("IMAGE_MODEL", "dall-e-2")
+image_cache = ImageCache(
+    os.getenv("IMAGE_CACHE_DIR", "image_cache"),
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", "500")) * 1024 * 1024,
+    similarity=float(os.getenv("IMAGE_CACHE_SIMILARITY", "0"))
+)
+
+# Story images served by URL, stored once under a hash of their bytes
+asset_store = AssetStore(
+    os.getenv("ASSET_DIR", "assets"),
+    max_bytes=int(os.getenv("ASSET_MAX_MB", "1024")) * 1024 * 1024
+)
+
+# Narration segments on disk, keyed by text, voice id and voice settings
+audio_cache = AudioCache(
+    os.getenv("AUDIO_CACHE_DIR", "audio_cache"),
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_MB", "200")) * 1024 * 1024
+)
+tts_max_workers = int(os.getenv("TTS_MAX_WORKERS", "4"))
+tts_retries = int(os.getenv("TTS_RETRIES", "1"))
+
+# Image generation fan-out settings
+image_max_workers = int(os.getenv("IMAGE_MAX_WORKERS", "4"))
+image_retries = int(os.getenv("IMAGE_RETRIES", "1"))
+# Images per minute allowed against OpenAI, 0 disables the limit
+image_limiter = RateLimiter(int(os.getenv("IMAGE_RATE_LIMIT", "0")))
+
+# Frame description fan-out settings for batch stories
+vision_max_workers = int(os.getenv("VISION_MAX_WORKERS", "4"))
+vision_limiter = RateLimiter(int(os.getenv("VISION_RATE_LIMIT", "0")))
+
+# Time budget shared by every provider call one request makes, 0 for none
+request_deadline = float(os.getenv("REQUEST_DEADLINE", "180"))
+
+def error_status(error):
+    """503 while a provider's circuit is open, 504 when the request ran out of time, else 500"""
+    if isinstance(error, CircuitOpenError):
+        return 503
+    if isinstance(error, DeadlineExceeded):
+        return 504
+    return 500
+
+def provider_policy(name, timeout, retries, **options):
+    """Timeouts, backoff and a circuit breaker for calls to one provider"""
+    breaker = CircuitBreaker(name, failures=int(os.getenv("BREAKER_FAILURES", "5")),
+                             reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", "30")))
+    return CallPolicy(name, timeout=timeout, retries=retries,
+                      backoff=float(os.getenv("RETRY_BACKOFF", "0.5")),
+                      max_backoff=float(os.getenv("RETRY_MAX_BACKOFF", "8")),
+                      breaker=breaker, **options)
+
+vision_policy = provider_policy('vision', float(os.getenv("VISION_TIMEOUT", "30")),
+                                int(os.getenv("VISION_RETRIES", "1")), limiter=vision_limiter)
+chat_policy = provider_policy('chat', float(os.getenv("CHAT_TIMEOUT", "60")), int(os.getenv("CHAT_RETRIES", "1")))
+# Image calls have the longest tail, so a slow one can be raced against a duplicate
+image_policy = provider_policy('image', float(os.getenv("IMAGE_TIMEOUT", "60")), image_retries,
+                               hedge_after=float(os.getenv("IMAGE_HEDGE_AFTER", "0")), limiter=image_limiter)
+speech_policy = provider_policy('speech', float(os.getenv("TTS_TIMEOUT", "30")), tts_retries)
+
+# Admission control: a token bucket per client address, then a cap on requests in
+# flight per provider with a bounded queue; anything beyond gets 429 and Retry-After
+admission = Admission(
+    create_admission_store(os.getenv("ADMISSION_STORE", "memory")),
+    rate=float(os.getenv("CLIENT_RATE_LIMIT", "60")),
+    burst=float(os.getenv("CLIENT_BURST", "20")),
+    limits={
+        'vision': int(os.getenv("VISION_CONCURRENCY", "32")),
+        'chat': int(os.getenv("CHAT_CONCURRENCY", "16")),
+        'speech': int(os.getenv("SPEECH_CONCURRENCY", "16")),
+    },
+    queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "32")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+    # Slots left behind by a crashed worker free themselves after this long
+    lease=(request_deadline or 600) + 60
+)
+
+@api.app_errorhandler(413)
+def upload_too_large(error):
+    """Answer bodies over MAX_UPLOAD_MB in the usual JSON shape"""
+    return jsonify({'success': False, 'error': f'Upload is larger than {max_upload_bytes // (1024 * 1024)} MB'}), 413
+
+def admitted(pool, cost=1):
+    """Charge the client's bucket and hold a slot in the provider pool until the response is sent"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                admission.charge(request.remote_addr or 'unknown', cost)
+                slot = admission.acquire(pool) if pool else None
+            except AdmissionRejected as e:
+                return (jsonify({'success': False, 'error': str(e)}), 429,
+                        {'Retry-After': str(max(1, math.ceil(e.retry_after)))})
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                admission.release(slot)
+                raise
+            if response.is_streamed:
+                # Streams do their work after the view returns, so keep the slot until they close
+                response.call_on_close(lambda: admission.release(slot))
+            else:
+                admission.release(slot)
+            return response
+        return wrapper
+    return decorator
+# Admin routes answer only requests carrying this token in X-Admin-Token; unset, they are off
+admin_token = os.getenv("ADMIN_TOKEN", "")
+
+def admin_only(view):
+    """Refuse the request unless admin routes are enabled and it carries the admin token"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not admin_token:
+            return jsonify({'success': False, 'error': 'Admin routes are disabled'}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), admin_token.encode()):
+            return jsonify({'success': False, 'error': 'Invalid admin token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+batch_max_frames = int(os.getenv("BATCH_MAX_FRAMES", "500"))
+# Largest uncompressed frame read from a zip, so a small archive cannot expand into gigabytes
+batch_max_frame_bytes = int(os.getenv("BATCH_MAX_FRAME_MB", "20")) * 1024 * 1024
+# All frames of a batch together, uploaded directly or expanded from zips
+batch_max_bytes = int(os.getenv("BATCH_MAX_MB", "200")) * 1024 * 1024
+frame_extensions = ('.jpg', '.jpeg', '.png', '.webp')
+frame_mime_types = ('image/jpeg', 'image/png', 'image/webp')
+# Frames whose perceptual hashes differ by at most this many bits count as the same scene
+frame_hash_distance = int(os.getenv("FRAME_HASH_DISTANCE", "6"))
+
+story_prompt = '''Give a short story with a description of an image that would suit each paragraph.
+Write every part of the story as:
+Paragraph: <paragraph text>
+Image Description: <description of an image for that paragraph>
+
+The story is based on this image description:
+{description}'''
+
+story_json_prompt = '''Give a short story with a description of an image that would suit each paragraph.
+Reply with JSON only, in the form {{"story": [{{"paragraph": "...", "image_description": "..."}}]}}.
+
+The story is based on this image description:
+{description}'''
+
+# text: parse "Paragraph:" / "Image Description:" sections, json: ask the model for structured output
+story_format = os.getenv("STORY_FORMAT", "text")
+
+batch_prompt_intro = 'The image description is a sequence of scenes from consecutive video frames, in order.'
+
+# Image descriptions by description id, shared by every worker process
+state_store = create_state_store(os.getenv("STATE_STORE", "memory"),
+                                 ttl=int(os.getenv("STATE_TTL", "3600")))
+
+@contextmanager
+def upload_bytes(upload):
+    """Yield the bytes of an uploaded file, as a view of the request buffer when it is in memory"""
+    if isinstance(upload.stream, io.BytesIO):
+        with upload.stream.getbuffer() as view:
+            yield view
+    else:
+        upload.stream.seek(0)
+        yield upload.stream.read()
+
+def image_data_url(image_bytes, mime_type='image/jpeg', chunk_size=3 * 64 * 1024):
+    """Build a base64 data URL as a str for the vision SDK
+
+    The image is encoded in chunks into one buffer of the exact final size,
+    so the only full-size copies are that buffer and the str decoded from it.
+    """
+    prefix = f'data:{mime_type};base64,'.encode('ascii')
+    view = memoryview(image_bytes)
+    url = bytearray(len(prefix) + (len(view) + 2) // 3 * 4)
+    url[:len(prefix)] = prefix
+    position = len(prefix)
+    # Chunks are a multiple of 3 bytes so no padding appears mid-stream
+    for start in range(0, len(view), chunk_size):
+        encoded = base64.b64encode(view[start:start + chunk_size])
+        url[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    return url.decode('ascii')
+
+def save_description(description):
+    """Store a description and return the id clients use to refer to it"""
+    description_id = new_id()
+    state_store.set(description_id, {'description': description})
+    return description_id
+
+def requested_description():
+    """Return the description named by description_id, or the description text sent by the client
+
+    The text is also the fallback when the id is unknown or has expired.
+    """
+    body = request.get_json(silent=True) or {}
+    description_id = body.get('description_id') or request.args.get('description_id')
+    if description_id:
+        entry = state_store.get(description_id)
+        if entry:
+            return entry['description']
+        logger.info(f"Unknown or expired description id {description_id}, falling back to the description text")
+    return body.get('description') or body.get('prompt')
+
+missing_description_error = 'No image description available. Please generate a description first.'
+
+def describe_image(image_bytes, prompt='Describe this image like a cartoon image.', mime_type='image/jpeg'):
+    """Describe an image with LLAVA, reusing the description of identical uploads"""
+    key = description_cache.key(image_bytes, llava_model, prompt)
+    description = description_cache.get(key)
+    if description is None:
+        metrics.record_bytes('encode', 'in', len(image_bytes))
+        with metrics.stage('encode'):
+            # Downscale and re-encode for the model before sending
+            prepared = prepare_image(image_bytes, **vision_profile(llava_model))
+            if prepared:
+                image_bytes, mime_type = prepared
+            image_url = image_data_url(image_bytes, mime_type)
+        metrics.record_bytes('vision', 'out', len(image_url))
+        with metrics.stage('vision'):
+            description = vision_policy.call(providers.vision.describe, image_url, prompt, llava_model)
+        description_cache.set(key, description)
+    return description
+
+@api.route('/generate_description', methods=['POST'])
+@admitted('vision', cost=1)
 def generate_description():
     """Generate description from uploaded image using LLAVA"""
-    global latest_image_description
     
     if 'image' not in request.files:
         return jsonify({'error': 'No image file uploaded'}), 400
     
     try:
         image = request.files['image']
-        default_prompt = 'Describe this image like a cartoon image.'
+        mime_type = image.mimetype if image.mimetype.startswith('image/') else 'image/jpeg'
 
-        # Save and encode the image
-        image_path = secure_filename(image.filename)
-        image.save(image_path)
-        base64_image = encode_image(image_path)
-
-        # Get image description
-        latest_image_description = image_to_text(Groq(api_key=grok_api_key), llava_model, base64_image, default_prompt)
-        
-        # Clean up the saved image
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        # Get image description straight from the request buffer
+        with deadline(request_deadline), upload_bytes(image) as image_bytes:
+            description = describe_image(image_bytes, mime_type=mime_type)
+        if speculate_stories:
+            speculate(description)
         
         return jsonify({
             'success': True,
-            'description': latest_image_description
+            'description': description,
+            'description_id': save_description(description)
         })
         
     except Exception as e:
         logger.error(f"Error generating description: {str(e)}")
-        if os.path.exists(image_path):
-            os.remove(image_path)
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), error_status(e)
 
-def ChatGPT_conversation(conversation):
+def ChatGPT_conversation(conversation, **options):
     """Handle the conversation with GPT model"""
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=conversation,
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        conversation.append({
-            'role': response.choices[0].message.role,
-            'content': response.choices[0].message.content
-        })
+        with metrics.stage('chat'):
+            content = chat_policy.call(providers.chat.complete, conversation, **options)
+        conversation.append({'role': 'assistant', 'content': content})
         return conversation
     except Exception as e:
         logger.error(f"Error in ChatGPT conversation: {str(e)}")
         raise
 
-def generate_image(prompt):
-    """Generate an image using the OpenAI API"""
+def generate_image(prompt, size="1024x1024", n=1):
+    """Generate an image using the OpenAI API and return its asset key, reusing cached images for the same prompt"""
+    cached = image_cache.get(prompt, size, n, image_model)
+    if cached is not None:
+        return asset_store.put(cached)
+
+    def render():
+        try:
+            with metrics.stage('image'):
+                b64 = image_policy.call(providers.images.generate, prompt, size, n, image_model)
+            # Decode once; from here on the image only travels as bytes on disk
+            image_bytes = base64.b64decode(b64)
+            metrics.record_bytes('image', 'in', len(image_bytes))
+            image_cache.set(prompt, size, n, image_model, image_bytes)
+            return asset_store.put(image_bytes)
+        except Exception as e:
+            logger.error(f"Error generating image: {str(e)}")
+            raise
+
+    # A speculative run may already be drawing this prompt
+    key, _ = image_flights.do((prompt, size, n, image_model), render)
+    return key
+
+def image_urls(key):
+    """URLs of a stored story image and its variants, all None when the image failed"""
+    return {
+        'image_id': key,
+        'url': f"/images/{key}.png" if key else None,
+        'webp_url': f"/images/{key}.webp" if key else None,
+        'thumbnail_url': f"/images/{key}.thumb.webp" if key else None
+    }
+
+def generate_images(descriptions):
+    """Generate one image per description with bounded concurrency"""
+    results = run_ordered(generate_image, descriptions, max_workers=image_max_workers)
+    for index, outcome in enumerate(results):
+        logger.info(f"Image {index} finished in {outcome['elapsed']:.2f}s "
+                    f"after {outcome['attempts']} attempt(s)")
+    return results
+
+def story_pairs(description):
+    """Ask the chat model for a story and return its (paragraph, image description) pairs"""
+    # Initialize conversation with the image description and extract the
+    # paragraphs and image descriptions from the reply
+    if story_format == 'json':
+        conversation = [{'role': 'system', 'content': story_json_prompt.format(description=description)}]
+        conversation = ChatGPT_conversation(conversation, response_format={'type': 'json_object'})
+        pairs = parse_story_json(conversation[-1]['content'])
+    else:
+        conversation = [{'role': 'system', 'content': story_prompt.format(description=description)}]
+        conversation = ChatGPT_conversation(conversation)
+        pairs = parse_story(conversation[-1]['content'])
+    if not pairs:
+        raise ValueError('The story reply had no paragraphs')
+    return pairs
+
+def create_story(description, pairs=None):
+    """Write a story for an image description, unless its pairs are given, and illustrate each paragraph"""
+    if pairs is None:
+        pairs = story_pairs(description)
+    paragraphs = [paragraph for paragraph, _ in pairs]
+    image_descriptions = [image_description for _, image_description in pairs]
+
+    # Generate images concurrently, keeping paragraph order
+    images = []
+    results = generate_images(image_descriptions)
+    for index, (image_description, outcome) in enumerate(zip(image_descriptions, results)):
+        images.append({
+            'paragraph': paragraphs[index],
+            'description': image_description,
+            **image_urls(outcome['result']),
+            'error': outcome['error'],
+            'elapsed_ms': round(outcome['elapsed'] * 1000)
+        })
+
+    return {
+        'original_description': description,
+        'story_data': images,
+        'story_text': '\n\n'.join(paragraphs)
+    }
+
+def story_key(description):
+    """Story cache key: the description, the prompt template and the model settings that shape the story
+
+    Every route keys on the template of the configured STORY_FORMAT, so the
+    stream, which always asks for text, shares cached, in-flight and
+    speculative stories with the JSON routes.
+    """
+    template = story_json_prompt if story_format == 'json' else story_prompt
+    chat = providers.chat
+    params = {
+        'chat_model': getattr(chat, 'model', None),
+        'temperature': getattr(chat, 'temperature', None),
+        'max_tokens': getattr(chat, 'max_tokens', None),
+        'image_model': image_model,
+        'image_size': '1024x1024'
+    }
+    return story_cache.key(description, template, params)
+
+def cached_story(story, key):
+    """Return a story from the cache while all of its images are still stored"""
+    if story is None:
+        return None
+    if all(item['image_id'] and os.path.exists(asset_store.path(item['image_id'])) for item in story['story_data']):
+        return story
+    logger.info(f"Cached story {key[:12]} lost an image, writing it again")
+    return None
+
+def complete_story(story):
+    """True when the story has paragraphs and every one got its image, so the story is worth caching"""
+    return bool(story['story_data']) and all(item['error'] is None for item in story['story_data'])
+
+def archived_story(record):
+    """An archived story in the shape the story routes return, marking images the asset store no longer has"""
+    story_data = []
+    for item in record['story_data']:
+        stored = item['image_id'] and os.path.exists(asset_store.path(item['image_id']))
+        story_data.append({
+            'paragraph': item['paragraph'],
+            'description': item['description'],
+            **image_urls(item['image_id'] if stored else None),
+            'error': None if stored else 'Image no longer stored',
+            'elapsed_ms': 0
+        })
+    return {'original_description': record['original_description'], 'story_data': story_data,
+            'story_text': record['story_text']}
+
+def stored_story(key):
+    """Return the story for a key from the cache, or from the archive while it still has every image"""
+    story = cached_story(story_cache.get(key), key)
+    if story is not None:
+        return story
+    record = story_archive.latest(key)
+    if record is None:
+        return None
+    story = archived_story(record)
+    if not complete_story(story):
+        return None
+    story_cache.set(key, story)
+    return story
+
+def keep_story(key, story):
+    """Cache and archive a newly written story when every image came through"""
+    if complete_story(story):
+        story_cache.set(key, story)
+        story_archive.add(key, story)
+
+def shared_story(description, fresh=False):
+    """Return the story for a description, from the cache unless fresh is set
+
+    Identical requests that arrive while a story is being written wait for
+    that run instead of starting their own. A fresh story is always written
+    anew, without joining a run in flight, and replaces the cached one.
+    """
+    key = story_key(description)
+    if not fresh:
+        story = stored_story(key)
+        if story is not None:
+            return story
+
+    def write():
+        story = create_story(description, None if fresh else speculated_pairs(key))
+        keep_story(key, story)
+        return story
+
+    if fresh:
+        return write()
+    story, shared = story_flights.do(key, write)
+    if shared:
+        logger.info(f"Shared story {key[:12]} with a request already in flight")
+    return story
+
+def speculate_story(description, cancelled):
+    """Write the story pairs for a description ahead of time, starting the first images and narration"""
+    def ahead(func, item):
+        # The run may expire while this step waits for a speculation thread
+        if not cancelled.is_set():
+            run_task(func, item)
+
+    with deadline(request_deadline):
+        pairs = story_pairs(description)
+        if not cancelled.is_set():
+            # Picked up through image_flights and the image cache, or through the audio cache
+            for _, image_description in pairs[:speculate_images]:
+                submit(speculator.executor, ahead, generate_image, image_description)
+            if speculate_tts and pairs:
+                submit(speculator.executor, ahead, synthesize_segment, pairs[0][0].strip())
+    return pairs
+
+def speculate(description):
+    """Start the story for a new description in the background unless one is cached or archived"""
+    key = story_key(description)
+    if stored_story(key) is None:
+        speculator.start(key, speculate_story, description)
+
+def speculated_pairs(key):
+    """Claim the speculative story pairs for a key, waiting while they are written; None without a usable run"""
+    future = speculator.claim(key)
+    if future is None:
+        return None
     try:
-        res = openai_client.images.generate(
-            prompt=prompt,
-            n=1,
-            size="1024x1024",
-            response_format="b64_json"
-        )
-        return res.data[0].b64_json
+        pairs = future.result(timeout=remaining())
     except Exception as e:
-        logger.error(f"Error generating image: {str(e)}")
+        logger.info(f"Speculative story {key[:12]} not used: {str(e)}")
+        return None
+    logger.info(f"Using speculative story {key[:12]}")
+    return pairs
+
+def requested_fresh():
+    """True when the request asks for a new story rather than a cached one"""
+    body = request.get_json(silent=True) or {}
+    value = body.get('fresh', request.args.get('fresh', False))
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
+
+def sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def replay_story(story):
+    """Yield a finished story as the same Server-Sent Events a live one produces"""
+    for index, item in enumerate(story['story_data']):
+        yield sse('paragraph', {'index': index, 'paragraph': item['paragraph'], 'description': item['description']})
+        yield sse('image', {'index': index, **image_urls(item['image_id']),
+                            'error': item['error'], 'elapsed_ms': item['elapsed_ms']})
+    yield sse('done', {'original_description': story['original_description'], 'story_text': story['story_text']})
+
+def stream_story(description, fresh=False):
+    """Yield story paragraphs and images as Server-Sent Events as soon as each is ready
+
+    A request that arrives while the same story is being written waits for
+    that run and replays it, as shared_story does; fresh ones write their own.
+    """
+    key = story_key(description)
+    if fresh:
+        yield from write_stream(key, description)
+        return
+    cached = stored_story(key)
+    if cached is not None:
+        yield from replay_story(cached)
+        return
+
+    future, leader = story_flights.begin(key)
+    if not leader:
+        logger.info(f"Shared story {key[:12]} with a request already in flight")
+        yield from replay_story(future.result(timeout=remaining()))
+        return
+    try:
+        story = yield from write_stream(key, description, speculated_pairs(key))
+        future.set_result(story)
+    except Exception as e:
+        future.set_exception(e)
         raise
+    finally:
+        story_flights.end(key, future)
 
-@app.route('/generate_visual_story', methods=['POST'])
-def generate_visual_story():
-    """Generate story based on the latest image description"""
-    global latest_image_description
+def write_stream(key, description, speculated=None):
+    """Write a story as Server-Sent Events, from speculated pairs when given, and return it"""
+    conversation = [{'role': 'system', 'content': story_prompt.format(description=description)}]
+    parser = StoryStreamParser()
+    paragraphs = []
+    story_data = []
+    pending = {}
+
+    def image_events(block):
+        # Report images that have finished, waiting for at least one when block is set
+        if not pending:
+            return
+        done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            outcome = future.result()
+            image = {**image_urls(outcome['result']), 'error': outcome['error'],
+                     'elapsed_ms': round(outcome['elapsed'] * 1000)}
+            story_data[index].update(image)
+            yield sse('image', {'index': index, **image})
+
+    with ThreadPoolExecutor(max_workers=image_max_workers) as executor:
+        def start(pairs):
+            for paragraph, image_description in pairs:
+                index = len(paragraphs)
+                paragraphs.append(paragraph)
+                story_data.append({'paragraph': paragraph, 'description': image_description})
+                future = submit(executor, run_task, generate_image, image_description)
+                pending[future] = index
+                yield sse('paragraph', {'index': index, 'paragraph': paragraph,
+                                        'description': image_description})
+
+        if speculated is not None:
+            yield from start(speculated)
+        else:
+            with metrics.stage('chat_stream'):
+                for text in chat_policy.stream(providers.chat.stream, conversation):
+                    yield from start(parser.feed(text))
+                    yield from image_events(block=False)
+            yield from start(parser.close())
+        if not paragraphs:
+            raise ValueError('The story reply had no paragraphs')
+        while pending:
+            yield from image_events(block=True)
+
+    story = {'original_description': description, 'story_data': story_data, 'story_text': '\n\n'.join(paragraphs)}
+    keep_story(key, story)
+    yield sse('done', {'original_description': description, 'story_text': story['story_text']})
+    return story
 
+@api.route('/generate_visual_story/stream', methods=['GET', 'POST'])
+@admitted('chat', cost=2)
+def generate_visual_story_stream():
+    """Stream the story for an image description as Server-Sent Events"""
+    description = requested_description()
+    if not description:
+        return jsonify({'success': False, 'error': missing_description_error}), 400
+
+    fresh = requested_fresh()
+
+    def events():
+        try:
+            with deadline(request_deadline):
+                yield from stream_story(description, fresh)
+        except Exception as e:
+            logger.error(f"Error in story streaming: {str(e)}")
+            yield sse('error', {'error': str(e)})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/generate_visual_story', methods=['POST'])
+@admitted('chat', cost=2)
+def generate_visual_story():
+    """Generate story based on an image description"""
     try:
-        if not latest_image_description:
-            return jsonify({
-              'success': False,
-                'error': 'No image description available. Please generate a description first.'
-            }), 400
-
-        # Initialize conversation with the image description
-        conversation = []
-        conversation.append(
-            {
-                'role':'system', 
-                'content': f'''Give a short story with a description of an image that would suit each paragraph. The following is the prompt:
-                
-                Image Description:
-                {latest_image_description}
-                
-                Paragraph:'''
-            }
-        )
-        conversation = ChatGPT_conversation(conversation)
-        
-        # Extract the paragraphs and image descriptions from the conversation
-        image_descriptions = []
-        paragraphs = []
-        for message in conversation:
-            if message['role'] == 'assistant':
-                content = message['content']
-                if 'Image Description:' in content:
-                    image_descriptions.append(content.split('Image Description:')[1].strip())
-                elif 'Paragraph:' in content:
-                    paragraphs.append(content.split('Paragraph:')[1].strip())
-
-        # Generate images
-        images = []
-        for index, description in enumerate(image_descriptions):
-            image_data = generate_image(description)
-            images.append({
-                'paragraph': paragraphs[index],
-                'description': description,
-                'data': image_data
-            })
-
-        story_text = '\n\n'.join(paragraphs)
+        description = requested_description()
+        if not description:
+            return jsonify({'success': False, 'error': missing_description_error}), 400
+
+        with deadline(request_deadline):
+            story = shared_story(description, requested_fresh())
         
         return jsonify({
            'success': True,
-           'original_description': latest_image_description,
-           'story_data': images,
-           'story_text': story_text
+           **story
         })
 
     except Exception as e:
@@ -190,73 +726,403 @@ def generate_visual_story():
         return jsonify({
            'success': False,
             'error': str(e)
-        }), 500
+        }), error_status(e)
 
-def generate_image(prompt):
-    """Generate an image using the OpenAI API"""
-    try:
-        res = openai_client.images.generate(
-            prompt=prompt,
-            n=1,
-            size="1024x1024",
-            response_format="b64_json"
-        )
-        return res.data[0].b64_json
-    except Exception as e:
-        logger.error(f"Error generating image: {str(e)}")
-        raise
+def synthesize_speech(story_text):
+    """Convert story text to MP3 audio bytes with Eleven Labs"""
+    metrics.record_bytes('tts', 'out', len(story_text))
+    with metrics.stage('tts'):
+        audio = speech_policy.call(providers.speech.synthesize, story_text, elevenlabs_voice_id, voice_settings)
+    metrics.record_bytes('tts', 'in', len(audio))
+    return audio
+
+def story_segments():
+    """Return the paragraphs to narrate from the request, splitting story_text on blank lines"""
+    body = request.get_json(silent=True) or {}
+    paragraphs = body.get('paragraphs')
+    if paragraphs is None:
+        paragraphs = re.split(r'\n\s*\n', body.get('story_text', ''))
+    return [paragraph.strip() for paragraph in paragraphs if paragraph and paragraph.strip()]
+
+def synthesize_segment(text):
+    """Narrate one paragraph unless it is already cached, and return its audio key"""
+    key = audio_cache.key(text, elevenlabs_voice_id, voice_settings)
+    if not audio_cache.contains(key):
+        # A speculative run may already be narrating this paragraph
+        segment_flights.do(key, lambda: audio_cache.set(key, synthesize_speech(text)))
+    return key
+
+def start_segments(segments):
+    """Synthesize segments concurrently and return their futures in story order"""
+    executor = ThreadPoolExecutor(max_workers=max(1, min(tts_max_workers, len(segments))))
+    futures = [submit(executor, run_task, synthesize_segment, segment) for segment in segments]
+    # Let the pool wind down by itself once every segment is done
+    executor.shutdown(wait=False)
+    return futures
 
-@app.route('/hear_story', methods=['POST'])
+@api.route('/hear_story', methods=['POST'])
+@admitted('speech', cost=1)
 def hear_story():
+    """Stream the narration of the story back to the client as one MP3, paragraph by paragraph"""
     try:
-        # Get the story text from the request
-        story_text = request.json['story_text']
-
-        # Set up the text-to-speech request
-        url = "https://api.elevenlabs.io/v1/text-to-speech/pNInz6obpgDQGcFmaJgB"
-        payload = {
-            "text": story_text,
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.8,
-                "style": 1,
-                "use_speaker_boost": False
-            }
-        }
-        headers = {
-            "xi-api-key": elevenlabs_api_key,
-            "Content-Type": "application/json"
-        }
-
-        # Send the text-to-speech request
-        response = requests.post(url, json=payload, headers=headers)
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Use BytesIO to handle the audio data in memory
-            audio_data = io.BytesIO(response.content)
-
-            # Initialize pygame mixer
-            pygame.mixer.init()
-
-            # Load and play the audio from memory
-            pygame.mixer.music.load(audio_data)
-            print("Playing audio...")
-            pygame.mixer.music.play()
-
-            # Wait for the audio to finish
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
-
-            # Return a success response
-            return jsonify({'success': True})
-        else:
-            # Return an error response
-            return jsonify({'success': False, 'error': response.text}), 500
+        segments = story_segments()
+        if not segments:
+            return jsonify({'success': False, 'error': 'No story text to narrate'}), 400
+
+        with deadline(request_deadline):
+            futures = start_segments(segments)
+        # Wait for the first paragraph so a failing provider still gets an error response
+        first = futures[0].result()
+        if first['error']:
+            return jsonify({'success': False, 'error': first['error']}), 500
 
     except Exception as e:
         logger.error(f"Error in hearing story: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500 
+
+    def chunks():
+        for index, future in enumerate(futures):
+            outcome = future.result()
+            if outcome['error']:
+                logger.error(f"Stopping narration at paragraph {index}: {outcome['error']}")
+                return
+            with open(audio_cache.path(outcome['result']), 'rb') as audio_file:
+                while True:
+                    chunk = audio_file.read(64 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    return Response(chunks(), mimetype='audio/mpeg', headers={'Cache-Control': 'no-store'})
+
+@api.route('/hear_story/playlist', methods=['POST'])
+@admitted('speech', cost=1)
+def hear_story_playlist():
+    """Narrate each paragraph and return an ordered list of audio URLs"""
+    segments = story_segments()
+    if not segments:
+        return jsonify({'success': False, 'error': 'No story text to narrate'}), 400
+
+    playlist = []
+    with deadline(request_deadline):
+        futures = start_segments(segments)
+    for index, future in enumerate(futures):
+        outcome = future.result()
+        playlist.append({
+            'index': index,
+            'url': f"/audio/{outcome['result']}.mp3" if outcome['result'] else None,
+            'error': outcome['error']
+        })
+    return jsonify({'success': all(item['error'] is None for item in playlist), 'segments': playlist})
+
+@api.route('/audio/<key>.mp3', methods=['GET'])
+def audio_segment(key):
+    """Serve a cached narration segment with Range and caching support"""
+    if not re.fullmatch(r'[0-9a-f]{64}', key) or not os.path.exists(audio_cache.path(key)):
+        return jsonify({'success': False, 'error': 'Unknown audio segment'}), 404
+    # Segments are content addressed, so they never change
+    return send_file(os.path.abspath(audio_cache.path(key)), mimetype='audio/mpeg',
+                     conditional=True, max_age=31536000)
     
+@api.route('/images/<name>', methods=['GET'])
+def story_image(name):
+    """Serve a story image, or its WebP or thumbnail variant, with an ETag and long-lived caching"""
+    match = re.fullmatch(r'([0-9a-f]{64})\.(png|webp|thumb\.webp)', name)
+    if not match:
+        return jsonify({'success': False, 'error': 'Unknown image'}), 404
+    key, variant = match.group(1), match.group(2).split('.')[0]
+    path = asset_store.path(key, variant)
+    try:
+        if variant != 'png' and not os.path.exists(path):
+            # Render the variant from the original on first request
+            with open(asset_store.path(key), 'rb') as image_file:
+                data = image_variant(image_file.read(), **IMAGE_VARIANTS[variant])
+            if data is None:
+                return jsonify({'success': False, 'error': 'Image cannot be converted'}), 500
+            asset_store.set_variant(key, variant, data)
+        # Images are content addressed, so they never change
+        response = send_file(os.path.abspath(path), mimetype=MIME_TYPES['PNG' if variant == 'png' else 'WEBP'],
+                             conditional=True, etag=f'{key}.{variant}', max_age=31536000)
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Unknown image'}), 404
+    response.cache_control.immutable = True
+    return response
+
+class FrameTooLarge(Exception):
+    """A zip entry would expand past BATCH_MAX_FRAME_MB, or the frames together past BATCH_MAX_MB"""
+
+def natural_key(name):
+    """Sort key that orders frame2.jpg before frame10.jpg"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+def zip_frames(archive):
+    """The image entries of a zip archive in natural file name order, skipping hidden and metadata files"""
+    entries = []
+    for info in archive.infolist():
+        name = info.filename.rsplit('/', 1)[-1]
+        if info.is_dir() or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        if not name.lower().endswith(frame_extensions):
+            continue
+        if info.file_size > batch_max_frame_bytes:
+            raise FrameTooLarge(f"{info.filename} is larger than {batch_max_frame_bytes // (1024 * 1024)} MB")
+        entries.append(info)
+    return sorted(entries, key=lambda info: natural_key(info.filename))
+
+def read_frames():
+    """Return the uploaded frames in order, from a list of image files or a zip archive
+
+    Sizes are checked before anything is read, against the declared size of
+    zip entries and the spooled size of direct uploads.
+    """
+    frames = []
+    total = 0
+
+    def count(size):
+        nonlocal total
+        total += size
+        if total > batch_max_bytes:
+            raise FrameTooLarge(f"Frames are larger than {batch_max_bytes // (1024 * 1024)} MB in total")
+
+    for upload in request.files.getlist('frames'):
+        if upload.filename.lower().endswith('.zip') or upload.mimetype == 'application/zip':
+            with zipfile.ZipFile(upload.stream) as archive:
+                for info in zip_frames(archive):
+                    if len(frames) >= batch_max_frames:
+                        break
+                    count(info.file_size)
+                    frames.append(archive.read(info))
+        elif upload.filename.lower().endswith(frame_extensions) or upload.mimetype in frame_mime_types:
+            count(upload.stream.seek(0, io.SEEK_END))
+            upload.stream.seek(0)
+            frames.append(upload.stream.read())
+        else:
+            logger.info(f"Skipping frame upload that is not an image: {upload.filename}")
+        if len(frames) >= batch_max_frames:
+            break
+    return frames[:batch_max_frames]
+
+@api.route('/generate_visual_story/batch', methods=['POST'])
+@admitted('vision', cost=5)
+def generate_batch_story():
+    """Describe a sequence of frames and write one story across the distinct scenes"""
+    try:
+        frames = read_frames()
+        if not frames:
+            return jsonify({'success': False, 'error': 'No frames uploaded'}), 400
+
+        with deadline(request_deadline):
+            # Only pay for inference on frames that start a new scene
+            kept = distinct_frames(frames, frame_hash_distance)
+            results = run_ordered(describe_image, [frames[index] for index in kept],
+                                  max_workers=vision_max_workers)
+            scenes = [
+                {'frame': index, 'description': outcome['result']}
+                for index, outcome in zip(kept, results) if outcome['error'] is None
+            ]
+            if not scenes:
+                return jsonify({'success': False, 'error': results[0]['error']}), 500
+
+            description = batch_prompt_intro + '\n' + '\n'.join(
+                f"Scene {number}: {scene['description']}" for number, scene in enumerate(scenes, 1)
+            )
+            story = shared_story(description, requested_fresh())
+
+        return jsonify({
+            'success': True,
+            'description_id': save_description(description),
+            'frames': len(frames),
+            'scenes': scenes,
+            **story
+        })
+
+    except zipfile.BadZipFile:
+        return jsonify({'success': False, 'error': 'Uploaded archive is not a valid zip file'}), 400
+    except FrameTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except Exception as e:
+        logger.error(f"Error in batch story generation: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), error_status(e)
+
+def story_summaries(stories):
+    """Archive summaries with a thumbnail URL for each story's first image"""
+    summaries = []
+    for story in stories:
+        cover_id = story.pop('cover_id')
+        summaries.append({**story, 'thumbnail_url': image_urls(cover_id)['thumbnail_url']})
+    return summaries
+
+def page_size():
+    """Stories per page requested with limit, between 1 and archive_page_max"""
+    return max(1, min(request.args.get('limit', 20, type=int), archive_page_max))
+
+@api.route('/stories', methods=['GET'])
+def list_stories():
+    """List archived stories newest first; pass next_cursor back as cursor for the next page"""
+    limit = page_size()
+    stories = story_archive.list(limit, request.args.get('cursor', type=int))
+    return jsonify({
+        'success': True,
+        'stories': story_summaries(stories),
+        'next_cursor': stories[-1]['id'] if len(stories) == limit else None
+    })
+
+@api.route('/stories/search', methods=['GET'])
+def search_stories():
+    """Search archived stories by their text, best matches first (or newest first with sort=recent)"""
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'success': False, 'error': 'Provide search text as q'}), 400
+    limit = page_size()
+    offset = request.args.get('cursor', 0, type=int)
+    stories = story_archive.search(text, limit, offset, recent=request.args.get('sort') == 'recent')
+    return jsonify({
+        'success': True,
+        'stories': story_summaries(stories),
+        'next_cursor': offset + limit if len(stories) == limit else None
+    })
+
+@api.route('/stories/<int:story_id>', methods=['GET'])
+def archived_story_view(story_id):
+    """Return an archived story in the same shape /generate_visual_story does"""
+    record = story_archive.get(story_id)
+    if record is None:
+        return jsonify({'success': False, 'error': 'Unknown story'}), 404
+    return jsonify({'success': True, 'id': record['id'], 'created_at': record['created_at'],
+                    **archived_story(record)})
+
+@api.route('/admin/cache', methods=['GET'])
+@admin_only
+def cache_stats():
+    """Report cache sizes and hit rates"""
+    return jsonify({
+        'success': True,
+        'descriptions': description_cache.stats(),
+        'stories': {**story_cache.stats(), 'shared': story_flights.shared},
+        'images': image_cache.stats(),
+        'assets': asset_store.stats(),
+        'audio': audio_cache.stats()
+    })
+
+@api.route('/admin/cache', methods=['DELETE'])
+@admin_only
+def purge_cache():
+    """Empty every cache, or only the one named by ?cache="""
+    name = request.args.get('cache')
+    if name not in (None, 'descriptions', 'stories', 'images', 'assets', 'audio'):
+        return jsonify({'success': False, 'error': 'Unknown cache'}), 400
+    if name in (None, 'descriptions'):
+        description_cache.clear()
+    if name in (None, 'stories'):
+        story_cache.clear()
+        # Otherwise the next request would bring the purged story back from the archive
+        story_archive.purge()
+    if name in (None, 'images'):
+        image_cache.purge()
+    if name in (None, 'assets'):
+        asset_store.purge()
+    if name in (None, 'audio'):
+        audio_cache.purge()
+    return jsonify({'success': True})
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose stage latencies, payload sizes, token usage and request latencies for Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def run_story_job(payload, image_bytes, set_stage):
+    """Run the describe, story, images and speech pipeline for a queued job"""
+    description = payload.get('description')
+    if not description:
+        set_stage('describe')
+        description = describe_image(image_bytes)
+    set_stage('story')
+    story = shared_story(description, bool(payload.get('fresh')))
+    audio = None
+    if payload.get('tts'):
+        set_stage('tts')
+        audio = synthesize_speech(story['story_text'])
+    return story, audio
+
+job_queue = JobQueue(JobStore(os.getenv("JOBS_DB", "jobs.db")), run_story_job,
+                     workers=int(os.getenv("JOB_WORKERS", "2")),
+                     lease=float(os.getenv("JOB_LEASE", "60")))
+
+@api.route('/jobs', methods=['POST'])
+@admitted(None, cost=2)
+def submit_job():
+    """Queue a story job from an uploaded image or an existing description"""
+    try:
+        if 'image' in request.files:
+            payload = {'tts': request.form.get('tts') == 'true', 'fresh': request.form.get('fresh') == 'true'}
+            image_bytes = request.files['image'].read()
+        else:
+            body = request.get_json(silent=True) or {}
+            if not body.get('description'):
+                return jsonify({'success': False, 'error': 'Provide an image file or a description'}), 400
+            payload = {'description': body['description'], 'tts': bool(body.get('tts')), 'fresh': bool(body.get('fresh'))}
+            image_bytes = None
+
+        job_id = job_queue.submit(payload, image_bytes)
+        return jsonify({'success': True, 'job_id': job_id}), 202
+
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the state of a story job"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': job['status'],
+        'stage': job['stage'],
+        'error': job['error'],
+        'has_audio': bool(job['has_audio'])
+    })
+
+@api.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Return the story of a finished job"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'success': False, 'error': job['error']}), 500
+    if job['status'] != 'done':
+        return jsonify({'success': False, 'status': job['status'], 'error': 'Job not finished'}), 409
+    return jsonify({'success': True, **json.loads(job['result'])})
+
+@api.route('/jobs/<job_id>/audio', methods=['GET'])
+def job_audio(job_id):
+    """Return the narration of a finished job"""
+    audio = job_queue.store.get_audio(job_id)
+    if audio is None:
+        return jsonify({'success': False, 'error': 'No audio for this job'}), 404
+    # conditional=True answers Range requests so players can seek
+    return send_file(io.BytesIO(audio), mimetype='audio/mpeg', conditional=True,
+                     download_name=f'{job_id}.mp3')
+
+def create_app(start_jobs=False, warm_clients=False):
+    """Build the Flask app, optionally starting the job workers and importing provider SDKs in the background"""
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = max_upload_bytes
+    CORS(app, origins=cors_origins, expose_headers=['Retry-After'])
+    app.register_blueprint(api)
+    if start_jobs:
+        job_queue.start()
+    if warm_clients and provider_kind == 'live':
+        # Serve right away; the first provider call waits only for whatever import is left
+        threading.Thread(target=clients.warm, name='warm-clients', daemon=True).start()
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
+    job_queue.start()
     app.run(port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,176 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Story metadata only; image bytes stay in the asset store and are referenced by their
+# 32-byte hash. The full-text index is contentless, so it holds no second copy of the text.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stories (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    description TEXT NOT NULL,
+    cover BLOB,
+    paragraphs INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stories_key ON stories (key, id);
+CREATE TABLE IF NOT EXISTS paragraphs (
+    story_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    paragraph TEXT NOT NULL,
+    description TEXT NOT NULL,
+    image BLOB,
+    PRIMARY KEY (story_id, position)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS story_search USING fts5(
+    description, body, content='', tokenize='porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS purges (
+    through_id INTEGER NOT NULL,
+    purged_at REAL NOT NULL
+);
+'''
+
+
+def _image(image_id):
+    return bytes.fromhex(image_id) if image_id else None
+
+
+def _image_id(image):
+    return image.hex() if image else None
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query that matches every word, the last one as a prefix"""
+    words = [f'"{word}"' for word in text.replace('"', ' ').split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+class StoryArchive:
+    """Every finished story kept in SQLite, listed newest first and searchable by its text
+
+    Reads map the database file into memory (mmap_bytes of it), so list and
+    search queries are served from the page cache without read() copies.
+    """
+
+    def __init__(self, path, mmap_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.mmap_bytes = mmap_bytes
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute(f'PRAGMA mmap_size = {int(self.mmap_bytes)}')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, key, story):
+        """Archive a finished story under its story cache key and return its id"""
+        items = story['story_data']
+        with self._connect() as conn:
+            story_id = conn.execute(
+                'INSERT INTO stories (key, description, cover, paragraphs, created_at) VALUES (?, ?, ?, ?, ?)',
+                (key, story['original_description'], _image(items[0]['image_id']) if items else None,
+                 len(items), time.time())
+            ).lastrowid
+            conn.executemany(
+                'INSERT INTO paragraphs (story_id, position, paragraph, description, image) VALUES (?, ?, ?, ?, ?)',
+                [(story_id, position, item['paragraph'], item['description'], _image(item['image_id']))
+                 for position, item in enumerate(items)]
+            )
+            body = '\n'.join(f"{item['paragraph']}\n{item['description']}" for item in items)
+            conn.execute('INSERT INTO story_search (rowid, description, body) VALUES (?, ?, ?)',
+                         (story_id, story['original_description'], body))
+        return story_id
+
+    def _summaries(self, rows):
+        return [{
+            'id': row['id'],
+            'description': row['description'],
+            'cover_id': _image_id(row['cover']),
+            'paragraphs': row['paragraphs'],
+            'created_at': row['created_at']
+        } for row in rows]
+
+    def list(self, limit=20, before=None):
+        """Return up to limit story summaries newest first, older than the id before when given"""
+        # Paging by id rather than OFFSET keeps deep pages as fast as the first
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, description, cover, paragraphs, created_at FROM stories '
+                'WHERE id < ? ORDER BY id DESC LIMIT ?',
+                (before if before is not None else 2 ** 63 - 1, limit)
+            ).fetchall()
+        return self._summaries(rows)
+
+    def search(self, text, limit=20, offset=0, recent=False):
+        """Return up to limit summaries of stories matching text, best matches first or newest first
+
+        Ranking scores every match, so for words found in most stories the
+        newest-first order, which stops after limit matches, is much cheaper.
+        """
+        query = match_query(text)
+        if not query:
+            return []
+        # Both orders sort ascending on position once joined to the stories
+        if recent:
+            hits = 'SELECT rowid, -rowid AS position FROM story_search WHERE story_search MATCH ? ORDER BY rowid DESC'
+        else:
+            hits = 'SELECT rowid, rank AS position FROM story_search WHERE story_search MATCH ? ORDER BY rank'
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT stories.id, description, cover, paragraphs, created_at '
+                f'FROM ({hits} LIMIT ? OFFSET ?) AS hits JOIN stories ON stories.id = hits.rowid ORDER BY hits.position',
+                (query, limit, offset)
+            ).fetchall()
+        return self._summaries(rows)
+
+    def _story(self, conn, row):
+        items = conn.execute(
+            'SELECT paragraph, description, image FROM paragraphs WHERE story_id = ? ORDER BY position',
+            (row['id'],)
+        ).fetchall()
+        return {
+            'id': row['id'],
+            'created_at': row['created_at'],
+            'original_description': row['description'],
+            'story_data': [{'paragraph': item['paragraph'], 'description': item['description'],
+                            'image_id': _image_id(item['image'])} for item in items],
+            'story_text': '\n\n'.join(item['paragraph'] for item in items)
+        }
+
+    def get(self, story_id):
+        """Return an archived story with its paragraphs, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT id, description, created_at FROM stories WHERE id = ?',
+                               (story_id,)).fetchone()
+            return self._story(conn, row) if row else None
+
+    def latest(self, key):
+        """Return the newest story written for a story cache key since the last purge, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT id, description, created_at FROM stories WHERE key = ? '
+                               'AND id > (SELECT COALESCE(MAX(through_id), 0) FROM purges) '
+                               'ORDER BY id DESC LIMIT 1', (key,)).fetchone()
+            return self._story(conn, row) if row else None
+
+    def purge(self):
+        """Stop answering story requests with the stories archived so far; they stay listed and searchable"""
+        with self._connect() as conn:
+            conn.execute('INSERT INTO purges (through_id, purged_at) SELECT COALESCE(MAX(id), 0), ? FROM stories',
+                         (time.time(),))
+
+    def stats(self):
+        with self._connect() as conn:
+            stories = conn.execute('SELECT COUNT(*) FROM stories').fetchone()[0]
+            pages, page_size = (conn.execute(f'PRAGMA {name}').fetchone()[0] for name in ('page_count', 'page_size'))
+        return {'entries': stories, 'bytes': pages * page_size}
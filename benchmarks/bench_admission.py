@@ -0,0 +1,114 @@
+"""Goodput under overload with and without admission control
+
+Stories run against stub providers that serve a fixed number of calls at
+once and queue the rest. Closed-loop clients, each with its own address,
+request stories for a fixed time at rising load; goodput counts stories
+finished within the latency objective. A last run puts one greedy client
+next to polite ones to show the per-client buckets keeping things fair.
+
+Usage: python benchmarks/bench_admission.py [--duration 10] [--loads 4,16,64] [--capacity 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_providers  # noqa: E402
+
+
+def drive(app, clients, duration, slo, threads_per_client=None):
+    """Run closed-loop clients for duration seconds; return per-client (good, rejected, failed)"""
+    threads_per_client = threads_per_client or [1] * clients
+    outcomes = [[0, 0, 0] for _ in range(clients)]
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def loop(index):
+        client = app.app.test_client()
+        address = f'10.0.{index // 250}.{index % 250 + 1}'
+        while time.monotonic() < stop:
+            start = time.monotonic()
+            # A distinct description per request so neither the story cache nor single-flight can share work
+            description = f'A fox by a river, seen by {address} at {start}'
+            response = client.post('/generate_visual_story', json={'description': description, 'fresh': True},
+                                   environ_base={'REMOTE_ADDR': address})
+            elapsed = time.monotonic() - start
+            with lock:
+                if response.status_code == 429:
+                    outcomes[index][1] += 1
+                elif response.status_code == 200 and elapsed <= slo:
+                    outcomes[index][0] += 1
+                else:
+                    outcomes[index][2] += 1
+            if response.status_code == 429:
+                # Polite clients honor Retry-After, capped so the run keeps moving
+                time.sleep(min(float(response.headers.get('Retry-After', 1)), 1.0))
+
+    workers = [threading.Thread(target=loop, args=(index,))
+               for index, count in enumerate(threads_per_client) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return outcomes
+
+
+def configure(app, enabled, chat_limit, rate=0):
+    app.admission.limits = {'chat': chat_limit} if enabled else {}
+    app.admission.rate = rate if enabled else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--loads", default="4,16,64", help="Comma separated client counts")
+    parser.add_argument("--capacity", type=int, default=8, help="Provider calls the stubs serve at once")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slo", type=float, default=5.0, help="Seconds within which a story counts as goodput")
+    args = parser.parse_args()
+
+    stubs = stub_providers.start(latency=args.latency, capacity=args.capacity)
+    stub_url = f'http://127.0.0.1:{stubs.server_port}'
+    workdir = tempfile.mkdtemp()
+    os.environ.update(
+        GROQ_API_KEY='stub', OPENAI_API_KEY='stub', ELEVENLABS_API_KEY='stub',
+        GROQ_BASE_URL=stub_url, OPENAI_BASE_URL=f'{stub_url}/v1', ELEVENLABS_BASE_URL=stub_url,
+        JOBS_DB=f'{workdir}/jobs.db', AUDIO_CACHE_DIR=f'{workdir}/audio_cache', ASSET_DIR=f'{workdir}/assets',
+        ARCHIVE_DB=f'{workdir}/archive.db', IMAGE_CACHE_DIR=f'{workdir}/image_cache', IMAGE_CACHE_MAX_MB='0',
+        CHAT_TIMEOUT=str(args.slo), IMAGE_TIMEOUT=str(args.slo), REQUEST_DEADLINE=str(args.slo * 2),
+        ADMISSION_QUEUE_TIMEOUT=str(args.slo / 2)
+    )
+    import logging
+    logging.disable(logging.WARNING)
+    import app
+
+    # A story makes one chat call and then three image calls at once, two calls in
+    # flight on average, so this many stories fill the stubs
+    chat_limit = max(1, args.capacity // 2)
+    print(f"stub capacity {args.capacity} calls, story limit {chat_limit}, objective {args.slo:.1f}s, "
+          f"{args.duration:.0f}s per run")
+    print(f"{'clients':>8} {'admission':>10} {'goodput/s':>10} {'429s':>6} {'failed':>7}")
+    for clients in [int(load) for load in args.loads.split(',')]:
+        for enabled in (False, True):
+            configure(app, enabled, chat_limit)
+            outcomes = drive(app, clients, args.duration, args.slo)
+            good, rejected, failed = (sum(column) for column in zip(*outcomes))
+            print(f"{clients:>8} {'on' if enabled else 'off':>10} {good / args.duration:>10.2f} "
+                  f"{rejected:>6} {failed:>7}")
+
+    # One client with 16 threads next to 8 clients with one thread each, 30 tokens a minute apiece
+    configure(app, True, chat_limit, rate=30)
+    outcomes = drive(app, 9, args.duration, args.slo, threads_per_client=[16] + [1] * 8)
+    greedy = outcomes[0][0]
+    polite = sum(outcome[0] for outcome in outcomes[1:]) / 8
+    print(f"fairness: greedy client finished {greedy} stories, each polite client {polite:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Query latency and size of the story archive
+
+Fills an archive with synthetic stories (three paragraphs and images each,
+words drawn from a Zipf-like vocabulary), then times the list, search and
+story routes through the app: the first page, a page deep in the archive,
+search terms of falling frequency, a word in nearly every story by relevance
+and by recency, and a single story. Runs with SQLite's memory-mapped reads
+on and off.
+
+Usage: python benchmarks/bench_archive.py [--stories 10000] [--queries 200]
+"""
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+THEMES = ('the fox river stone forest owl tower moon lantern dragon meadow castle ship storm garden bridge '
+          'robot cloud mountain rabbit whale island train candle mirror desert village comet bear wolf '
+          'kite puddle orchard lighthouse volcano glacier beetle parade library clock snowman balloon').split()
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'tu', 'sen', 'vel', 'dor', 'pim', 'qua', 'zel', 'bri')
+# Frequent theme words first, then made-up words, each drawn in proportion to 1 / rank
+WORDS = THEMES + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choices(WORDS, WEIGHTS, k=words)).capitalize() + '.'
+
+
+def synthetic_story(rng, index):
+    items = []
+    for position in range(3):
+        image_id = hashlib.sha256(f'{index}:{position}'.encode()).hexdigest()
+        items.append({'paragraph': ' '.join(sentence(rng, 12) for _ in range(3)),
+                      'description': sentence(rng, 10), 'image_id': image_id})
+    # One story in a thousand mentions a rare word
+    description = sentence(rng, 8) + (' A quetzal watches.' if index % 1000 == 0 else '')
+    return {'original_description': description, 'story_data': items}
+
+
+def timed(client, path, queries):
+    samples = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} returned {response.status_code}')
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stories", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200, help="Requests timed per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.update(PROVIDERS='fake', OPENAI_API_KEY='bench', GROQ_API_KEY='bench',
+                      ARCHIVE_DB=f'{workdir}/archive.db', JOBS_DB=f'{workdir}/jobs.db', ASSET_DIR=f'{workdir}/assets',
+                      IMAGE_CACHE_DIR=f'{workdir}/image_cache', AUDIO_CACHE_DIR=f'{workdir}/audio_cache')
+    import app
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    for index in range(args.stories):
+        app.story_archive.add(f'key{index}', synthetic_story(rng, index))
+    elapsed = time.perf_counter() - start
+    stats = app.story_archive.stats()
+    print(f"archived {stats['entries']} stories in {elapsed:.1f}s ({elapsed / args.stories * 1000:.2f} ms each), "
+          f"{stats['bytes'] / 1024 ** 2:.1f} MB on disk, {stats['bytes'] / stats['entries']:.0f} bytes per story")
+
+    client = app.app.test_client()
+    queries = {
+        'list first page': '/stories?limit=20',
+        'list deep page': f'/stories?limit=20&cursor={args.stories // 10}',
+        'search everywhere': '/stories/search?q=fox&limit=20',
+        'everywhere recent': '/stories/search?q=fox&limit=20&sort=recent',
+        'search common': '/stories/search?q=lighthouse&limit=20',
+        'search uncommon': '/stories/search?q=kalomi&limit=20',
+        'search rare': '/stories/search?q=quetzal&limit=20',
+        'search prefix': '/stories/search?q=lightho&limit=20',
+        'story': f'/stories/{args.stories // 2}',
+    }
+    with sqlite3.connect(os.environ['ARCHIVE_DB']) as conn:
+        for name, path in queries.items():
+            if 'search' in path and 'recent' not in path:
+                word = path.split('q=')[1].split('&')[0]
+                count = conn.execute('SELECT COUNT(*) FROM story_search WHERE story_search MATCH ?',
+                                     (f'"{word}"*',)).fetchone()[0]
+                print(f"{name}: '{word}' is in {count / args.stories:.0%} of stories")
+    print(f"{'query':>18} {'mmap':>5} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, path in queries.items():
+        for mmap_bytes in (256 * 1024 * 1024, 0):
+            app.story_archive.mmap_bytes = mmap_bytes
+            p50, p99 = timed(client, path, args.queries)
+            print(f"{name:>18} {'on' if mmap_bytes else 'off':>5} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
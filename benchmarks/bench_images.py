@@ -0,0 +1,48 @@
+"""Compare serial and concurrent story image generation against a fake image client
+
+Usage: python benchmarks/bench_images.py [--paragraphs 5] [--latency 1.0] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+workdir = tempfile.mkdtemp()
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.update(IMAGE_CACHE_DIR=f'{workdir}/image_cache', ASSET_DIR=f'{workdir}/assets', AUDIO_CACHE_DIR=f'{workdir}/audio_cache',
+                  ARCHIVE_DB=f'{workdir}/archive.db', JOBS_DB=f'{workdir}/jobs.db')
+
+import app  # noqa: E402
+from providers import FakeImages, LatencyModel  # noqa: E402
+
+
+def run(descriptions, workers):
+    app.image_max_workers = workers
+    app.image_cache.purge()
+    start = time.perf_counter()
+    results = app.generate_images(descriptions)
+    total = time.perf_counter() - start
+    per_image = ', '.join(f"{r['elapsed']:.2f}s" for r in results)
+    print(f"workers={workers}: total {total:.2f}s (per image: {per_image})")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paragraphs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds per fake image call")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    app.providers.images = FakeImages(LatencyModel(median=args.latency))
+    descriptions = [f"Scene {i}" for i in range(args.paragraphs)]
+
+    serial = run(descriptions, 1)
+    parallel = run(descriptions, args.workers)
+    print(f"speedup: {serial / parallel:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
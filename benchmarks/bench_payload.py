@@ -0,0 +1,87 @@
+"""Bytes sent for a story with base64 images in the JSON versus image URLs fetched as binary
+
+Uses fake providers that return 1024x1024 PNGs, then compares the old inline
+payload with the JSON plus PNG (and WebP) downloads, and the peak memory of
+building each response.
+
+Usage: python benchmarks/bench_payload.py
+"""
+import base64
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+workdir = tempfile.mkdtemp()
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.update(PROVIDERS='fake', PROVIDER_LATENCY_SCALE='0', ASSET_DIR=f'{workdir}/assets',
+                  ARCHIVE_DB=f'{workdir}/archive.db', IMAGE_CACHE_DIR=f'{workdir}/image_cache', JOBS_DB=f'{workdir}/jobs.db',
+                  AUDIO_CACHE_DIR=f'{workdir}/audio_cache')
+
+from PIL import Image  # noqa: E402
+
+import app  # noqa: E402
+
+
+class LargeImages:
+    """Returns noisy 1024x1024 PNGs about the size of generated ones, rendered up front"""
+
+    def __init__(self, count=3):
+        self.images = []
+        for seed in range(count):
+            bands = [Image.effect_noise((1024, 1024), 40 + seed) for _ in range(3)]
+            output = io.BytesIO()
+            Image.merge('RGB', bands).save(output, 'PNG')
+            self.images.append(base64.b64encode(output.getvalue()).decode('ascii'))
+        self.calls = 0
+
+    def generate(self, prompt, size, n, model, timeout=None):
+        self.calls += 1
+        return self.images[(self.calls - 1) % len(self.images)]
+
+
+def main():
+    app.providers.images = LargeImages()
+    client = app.app.test_client()
+
+    tracemalloc.start()
+    response = client.post('/generate_visual_story', json={'description': 'A fox by a river'})
+    _, url_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    story = response.get_json()
+    json_bytes = len(response.data)
+
+    png_bytes = webp_bytes = 0
+    images = []
+    for item in story['story_data']:
+        png = client.get(item['url']).data
+        images.append(png)
+        png_bytes += len(png)
+        webp_bytes += len(client.get(item['webp_url']).data)
+
+    # The previous response carried each PNG as base64 inside the JSON body
+    tracemalloc.start()
+    legacy = dict(story, story_data=[
+        {'paragraph': item['paragraph'], 'description': item['description'],
+         'data': base64.b64encode(png).decode('utf-8'), 'error': None}
+        for item, png in zip(story['story_data'], images)
+    ])
+    legacy_bytes = len(json.dumps(legacy).encode('utf-8'))
+    _, legacy_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"images: {len(images)}")
+    print(f"base64 in JSON:   {legacy_bytes / 1024:9.1f} KB (building the body peaks at {legacy_peak / 1024 ** 2:.1f} MB)")
+    print(f"JSON + PNG:       {(json_bytes + png_bytes) / 1024:9.1f} KB "
+          f"({1 - (json_bytes + png_bytes) / legacy_bytes:.0%} smaller; JSON alone {json_bytes} bytes, "
+          f"request peaks at {url_peak / 1024 ** 2:.1f} MB)")
+    print(f"JSON + WebP:      {(json_bytes + webp_bytes) / 1024:9.1f} KB "
+          f"({1 - (json_bytes + webp_bytes) / legacy_bytes:.0%} smaller)")
+
+
+if __name__ == '__main__':
+    main()
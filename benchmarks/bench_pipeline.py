@@ -0,0 +1,146 @@
+"""End-to-end pipeline benchmark against fake providers, no network needed
+
+Drives /generate_description, /generate_visual_story and /hear_story in
+process with concurrent clients. Providers sleep for latencies drawn from
+the recorded distributions in providers.RECORDED_LATENCY (scaled by
+--scale, seeded by --seed), and every provider call is timed per stage.
+Reports throughput, p50/p95/p99 per route and a per-stage breakdown.
+
+Usage: python benchmarks/bench_pipeline.py [--clients 8] [--sessions 40] [--scale 0.05]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class StageTimer:
+    """Wraps a provider and records how long each call takes under a stage name"""
+
+    def __init__(self, provider, stages, timings, lock):
+        self.provider = provider
+        self.stages = stages
+        self.timings = timings
+        self.lock = lock
+
+    def _record(self, stage, elapsed):
+        with self.lock:
+            self.timings.setdefault(stage, []).append(elapsed)
+
+    def __getattr__(self, name):
+        method = getattr(self.provider, name)
+        stage = self.stages.get(name)
+        if stage is None:
+            return method
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            if name == 'stream':
+                return self._timed_stream(stage, start, result)
+            self._record(stage, time.perf_counter() - start)
+            return result
+        return timed
+
+    def _timed_stream(self, stage, start, chunks):
+        yield from chunks
+        self._record(stage, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--scale", type=float, default=0.05, help="Multiplier on recorded provider latencies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.update({
+        'PROVIDERS': 'fake', 'PROVIDER_LATENCY_SCALE': str(args.scale),
+        'OPENAI_API_KEY': 'bench', 'GROQ_API_KEY': 'bench',
+        'IMAGE_CACHE_DIR': os.path.join(workdir, 'images'),
+        'ASSET_DIR': os.path.join(workdir, 'assets'),
+        'ARCHIVE_DB': os.path.join(workdir, 'archive.db'),
+        'AUDIO_CACHE_DIR': os.path.join(workdir, 'audio'),
+        'JOBS_DB': os.path.join(workdir, 'jobs.db'),
+        # Every session comes from the test client's one address, so the per-client limit would throttle it
+        'CLIENT_RATE_LIMIT': '0',
+    })
+    import logging
+    logging.disable(logging.INFO)
+    import app
+    from PIL import Image
+    from providers import create_providers
+
+    timings = {}
+    lock = threading.Lock()
+    fakes = create_providers('fake', latency_scale=args.scale, seed=args.seed)
+    app.providers.vision = StageTimer(fakes.vision, {'describe': 'vision'}, timings, lock)
+    app.providers.chat = StageTimer(fakes.chat, {'complete': 'chat', 'stream': 'chat'}, timings, lock)
+    app.providers.images = StageTimer(fakes.images, {'generate': 'image'}, timings, lock)
+    app.providers.speech = StageTimer(fakes.speech, {'synthesize': 'speech'}, timings, lock)
+
+    base = io.BytesIO()
+    Image.new('RGB', (1024, 768), (200, 120, 40)).save(base, 'JPEG')
+    base_image = base.getvalue()
+    routes = {'describe': [], 'story': [], 'hear': []}
+    failures = []
+
+    def session(index):
+        client = app.app.test_client()
+        # Trailing bytes keep the JPEG valid but make each upload unique, so caches stay cold
+        image = base_image + index.to_bytes(4, 'big')
+        start = time.perf_counter()
+        described = client.post('/generate_description', data={'image': (io.BytesIO(image), 'photo.jpg', 'image/jpeg')})
+        routes['describe'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        # Every fake description is the same, so fresh keeps the story cache from answering
+        story = client.post('/generate_visual_story',
+                            json={'description_id': described.json.get('description_id'), 'fresh': True})
+        routes['story'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        paragraphs = [segment['paragraph'] for segment in (story.json or {}).get('story_data', [])]
+        # Closing the streamed response is what releases its speech slot
+        with client.post('/hear_story', json={'paragraphs': paragraphs}) as heard:
+            heard.get_data()
+        routes['hear'].append(time.perf_counter() - start)
+
+        if not (described.status_code == story.status_code == heard.status_code == 200):
+            failures.append(index)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        list(executor.map(session, range(args.sessions)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.sessions} sessions, {args.clients} clients, latency scale {args.scale}: "
+          f"{elapsed:.2f}s, {len(failures)} failed")
+    print(f"throughput: {args.sessions / elapsed:.2f} sessions/s, {3 * args.sessions / elapsed:.2f} requests/s")
+    print("route             p50       p95       p99")
+    for route, values in routes.items():
+        print(f"  {route:10} {statistics.median(values) * 1000:7.0f}ms {percentile(values, 0.95) * 1000:7.0f}ms "
+              f"{percentile(values, 0.99) * 1000:7.0f}ms")
+    total = sum(sum(values) for values in timings.values())
+    print("stage         calls      mean       p95   share of provider time")
+    for stage, values in sorted(timings.items()):
+        print(f"  {stage:10} {len(values):6} {statistics.mean(values) * 1000:7.0f}ms "
+              f"{percentile(values, 0.95) * 1000:7.0f}ms   {sum(values) / total:5.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Bytes sent and describe latency with and without vision preprocessing
+
+The fake vision call takes a fixed inference time plus upload time at a given
+bandwidth, so smaller payloads show up as lower latency. Without --corpus a
+synthetic set of phone-sized photos and screenshots is generated.
+
+Usage: python benchmarks/bench_preprocess.py [--corpus DIR] [--bandwidth-mbps 20]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+workdir = tempfile.mkdtemp()
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.update(IMAGE_CACHE_DIR=f'{workdir}/image_cache', ASSET_DIR=f'{workdir}/assets', AUDIO_CACHE_DIR=f'{workdir}/audio_cache',
+                  ARCHIVE_DB=f'{workdir}/archive.db', JOBS_DB=f'{workdir}/jobs.db')
+
+from PIL import Image  # noqa: E402
+
+import app  # noqa: E402
+
+
+def synthetic_corpus():
+    """Phone photo with EXIF rotation, PNG screenshot, small JPEG and WebP frame"""
+    corpus = []
+    specs = [
+        ('phone.jpg', (4032, 3024), 'JPEG', 6),
+        ('screenshot.png', (2880, 1800), 'PNG', None),
+        ('small.jpg', (640, 480), 'JPEG', None),
+        ('frame.webp', (1920, 1080), 'WEBP', None),
+    ]
+    for name, size, format, orientation in specs:
+        image = Image.effect_noise(size, 60).convert('RGB')
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        output = io.BytesIO()
+        image.save(output, format=format, quality=95, exif=exif)
+        corpus.append((name, output.getvalue()))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as image_file:
+            corpus.append((name, image_file.read()))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="Directory of images to use instead of the synthetic set")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0)
+    parser.add_argument("--inference", type=float, default=0.3, help="Seconds of fake model time per call")
+    args = parser.parse_args()
+
+    sent = []
+
+    class FakeVision:
+        def describe(self, image_url, prompt, model, timeout=None):
+            sent.append(len(image_url))
+            time.sleep(args.inference + len(image_url) * 8 / (args.bandwidth_mbps * 1e6))
+            return 'A cartoon scene'
+
+    app.providers.vision = FakeVision()
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    real_prepare = app.prepare_image
+
+    for label, prepare in (('raw', lambda *a, **k: None), ('preprocessed', real_prepare)):
+        app.prepare_image = prepare
+        app.description_cache.clear()
+        sent.clear()
+        total = 0.0
+        print(f"{label}:")
+        for name, data in corpus:
+            start = time.perf_counter()
+            app.describe_image(data)
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            print(f"  {name:16} {len(data) / 1024:8.0f} KB upload, {sent[-1] / 1024:8.0f} KB sent, {elapsed * 1000:6.0f} ms")
+        print(f"  total {sum(sent) / 1024:.0f} KB sent, {total:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Story success rate and latency against fault-injecting stub providers
+
+Runs the same stories with the resilience layer switched off (no timeouts,
+retries, hedging or breakers) and on, then takes the stubs down entirely to
+show the circuit breakers failing fast and recovering.
+
+Usage: python benchmarks/bench_resilience.py [--stories 60] [--clients 8] [--error-rate 0.1]
+                                             [--slow-rate 0.05] [--slow-latency 4]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_providers  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_stories(app, count, clients):
+    """Return (latency, status, complete) for each story, complete meaning every image arrived"""
+    def story(index):
+        client = app.app.test_client()
+        start = time.perf_counter()
+        # fresh keeps the story cache from answering the later runs, which reuse these descriptions
+        response = client.post('/generate_visual_story',
+                               json={'description': f'A fox by a river, take {index}', 'fresh': True})
+        elapsed = time.perf_counter() - start
+        body = response.get_json(silent=True) or {}
+        complete = response.status_code == 200 and all(item['error'] is None for item in body.get('story_data', []))
+        return elapsed, response.status_code, complete
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        return list(executor.map(story, range(count)))
+
+
+def report(label, outcomes):
+    latencies = [elapsed for elapsed, _, _ in outcomes]
+    complete = sum(1 for _, _, done in outcomes if done)
+    statuses = {}
+    for _, status, _ in outcomes:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{label:<12} complete {complete}/{len(outcomes)}  p50 {statistics.median(latencies):.2f}s  "
+          f"p95 {percentile(latencies, 0.95):.2f}s  max {max(latencies):.2f}s  statuses {statuses}")
+
+
+def set_resilience(app, enabled, saved):
+    for policy in (app.vision_policy, app.chat_policy, app.image_policy, app.speech_policy):
+        if enabled:
+            policy.timeout, policy.retries, policy.hedge_after, policy.breaker.threshold = saved[policy.name]
+        else:
+            policy.timeout, policy.retries, policy.hedge_after, policy.breaker.threshold = 120, 0, 0, 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stories", type=int, default=60)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per healthy stub call")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=4.0)
+    args = parser.parse_args()
+
+    stubs = stub_providers.start(latency=args.latency, error_rate=args.error_rate,
+                                 slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    stub_url = f'http://127.0.0.1:{stubs.server_port}'
+    workdir = tempfile.mkdtemp()
+    os.environ.update(
+        GROQ_API_KEY='stub', OPENAI_API_KEY='stub', ELEVENLABS_API_KEY='stub',
+        GROQ_BASE_URL=stub_url, OPENAI_BASE_URL=f'{stub_url}/v1', ELEVENLABS_BASE_URL=stub_url,
+        JOBS_DB=f'{workdir}/jobs.db', AUDIO_CACHE_DIR=f'{workdir}/audio_cache', ASSET_DIR=f'{workdir}/assets',
+        ARCHIVE_DB=f'{workdir}/archive.db',
+        # A zero budget keeps every image uncached so each story calls the stubs
+        IMAGE_CACHE_DIR=f'{workdir}/image_cache', IMAGE_CACHE_MAX_MB='0',
+        # Every story comes from the test client's one address, so the per-client limit would throttle it
+        CLIENT_RATE_LIMIT='0'
+    )
+    os.environ.setdefault('CHAT_TIMEOUT', '2')
+    os.environ.setdefault('IMAGE_TIMEOUT', '2')
+    os.environ.setdefault('IMAGE_HEDGE_AFTER', '0.5')
+    os.environ.setdefault('RETRY_BACKOFF', '0.05')
+    os.environ.setdefault('CHAT_RETRIES', '2')
+    os.environ.setdefault('IMAGE_RETRIES', '2')
+    os.environ.setdefault('BREAKER_RESET_SECONDS', '1')
+    import app
+
+    saved = {policy.name: (policy.timeout, policy.retries, policy.hedge_after, policy.breaker.threshold)
+             for policy in (app.vision_policy, app.chat_policy, app.image_policy, app.speech_policy)}
+    print(f"{args.stories} stories, {args.clients} clients, {args.error_rate:.0%} errors, "
+          f"{args.slow_rate:.0%} calls held {args.slow_latency:.1f}s")
+
+    set_resilience(app, False, saved)
+    report('baseline', run_stories(app, args.stories, args.clients))
+    set_resilience(app, True, saved)
+    report('resilient', run_stories(app, args.stories, args.clients))
+
+    # Take every provider down: once the breakers open, stories fail fast with 503
+    stubs.RequestHandlerClass.down = True
+    report('outage', run_stories(app, args.stories // 2, args.clients))
+    stubs.RequestHandlerClass.down = False
+    # One story is the half-open trial that closes the breakers again. An injected fault can fail
+    # it and reopen them, so wait out the reset and try again until one completes
+    for _ in range(10):
+        time.sleep(float(os.environ['BREAKER_RESET_SECONDS']))
+        trial = run_stories(app, 1, 1)
+        if trial[0][2]:
+            break
+    report('trial', trial)
+    report('recovered', run_stories(app, args.stories // 2, args.clients))
+
+    metrics = app.metrics.render().splitlines()
+    for line in metrics:
+        if line.startswith(('imagetales_provider_retries', 'imagetales_provider_hedges',
+                            'imagetales_provider_rejections')):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Perceived latency with and without speculative stories, against fake providers
+
+Each session uploads an image, waits for the user's think time, asks for
+the story by description id and then for its narration playlist. The wait
+after the click is what the user sees. Some sessions can be abandoned after
+the description (--abandon) to show what unclaimed speculation costs:
+provider calls per story the user actually asked for.
+
+Usage: python benchmarks/bench_speculation.py [--sessions 6] [--think 0,1,3] [--scale 0.2] [--abandon 0.3]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Counted:
+    """Wraps a provider method and counts its calls"""
+
+    def __init__(self, provider, method):
+        self.provider = provider
+        self.method = method
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.provider, name)
+        if name != self.method:
+            return attribute
+
+        def counted(*args, **kwargs):
+            with self.lock:
+                self.calls += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+
+class UniqueVision:
+    """Numbers each description so every session gets its own story"""
+
+    def __init__(self, vision):
+        self.vision = vision
+        self.calls = 0
+
+    def describe(self, *args, **kwargs):
+        self.calls += 1
+        return f"{self.vision.describe(*args, **kwargs)} (scene {self.calls})"
+
+
+def session(client, index, think, abandon):
+    """Run one user session and return (story wait, narration wait) in seconds, or None when abandoned"""
+    from PIL import Image
+
+    upload = io.BytesIO()
+    # A different size per session so no two uploads share a cached description
+    Image.new('RGB', (64 + index, 64), (200, 120, 90)).save(upload, 'JPEG')
+    response = client.post('/generate_description', data={'image': (io.BytesIO(upload.getvalue()), 'scene.jpg')})
+    description_id = response.get_json()['description_id']
+    if abandon:
+        return None
+    time.sleep(think)
+
+    clicked = time.perf_counter()
+    story = client.post('/generate_visual_story', json={'description_id': description_id}).get_json()
+    story_wait = time.perf_counter() - clicked
+    playlist = client.post('/hear_story/playlist', json={'story_text': story['story_text']}).get_json()
+    if not story['success'] or not playlist['success']:
+        raise RuntimeError('Session failed')
+    return story_wait, time.perf_counter() - clicked
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=6, help="Sessions per think time and mode")
+    parser.add_argument("--think", default="0,1,3", help="Comma separated think times in seconds")
+    parser.add_argument("--scale", type=float, default=0.2, help="Multiplier on recorded provider latencies")
+    parser.add_argument("--abandon", type=float, default=0.3, help="Share of sessions that never ask for the story")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.update({
+        'PROVIDERS': 'fake', 'PROVIDER_LATENCY_SCALE': str(args.scale),
+        'OPENAI_API_KEY': 'bench', 'GROQ_API_KEY': 'bench',
+        'IMAGE_CACHE_DIR': os.path.join(workdir, 'images'),
+        'ASSET_DIR': os.path.join(workdir, 'assets'),
+        'ARCHIVE_DB': os.path.join(workdir, 'archive.db'),
+        'AUDIO_CACHE_DIR': os.path.join(workdir, 'audio'),
+        'JOBS_DB': os.path.join(workdir, 'jobs.db'),
+        # Every session comes from the test client's one address, so the per-client limit would throttle it
+        'CLIENT_RATE_LIMIT': '0',
+        'SPECULATE_TTS': 'true',
+    })
+    import logging
+    logging.disable(logging.INFO)
+    import app
+    from concurrency import Speculator
+
+    app.providers.vision = UniqueVision(app.providers.vision)
+    app.providers.chat = Counted(app.providers.chat, 'complete')
+    app.providers.images = Counted(app.providers.images, 'generate')
+    app.providers.speech = Counted(app.providers.speech, 'synthesize')
+    client = app.app.test_client()
+    rng = random.Random(args.seed)
+    index = 0
+
+    print(f"latency scale {args.scale}, {args.sessions} sessions per row, {args.abandon:.0%} abandoned")
+    print(f"{'think s':>8} {'speculate':>10} {'story wait':>11} {'narration wait':>15} {'calls/story':>12}")
+    for think in [float(value) for value in args.think.split(',')]:
+        for enabled in (False, True):
+            app.speculate_stories = enabled
+            app.speculator = Speculator()
+            calls_before = sum(provider.calls for provider in (app.providers.chat, app.providers.images,
+                                                                app.providers.speech))
+            waits = []
+            for _ in range(args.sessions):
+                index += 1
+                outcome = session(client, index, think, rng.random() < args.abandon)
+                if outcome:
+                    waits.append(outcome)
+            # Let unclaimed runs and the images they started finish so their calls count against this row
+            wait([future for future, _, _ in app.speculator.runs.values()])
+            app.speculator.executor.shutdown(wait=True)
+            calls = sum(provider.calls for provider in (app.providers.chat, app.providers.images,
+                                                         app.providers.speech)) - calls_before
+            print(f"{think:>8.1f} {'on' if enabled else 'off':>10} "
+                  f"{statistics.median(wait[0] for wait in waits):>10.2f}s "
+                  f"{statistics.median(wait[1] for wait in waits):>14.2f}s {calls / max(1, len(waits)):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Cold start: import time of the app and time until a fresh process answers its first requests
+
+Runs python -X importtime on `import app` and lists the slowest imports, then
+starts the app in new processes against local stub providers and times how
+long after spawning each one answers /metrics (ready) and a first story. Runs
+with the provider SDKs imported up front, as the app used to, are shown next
+to lazy imports with and without background warming. --budget-ms fails the
+run when the median first story of the default mode is slower, for CI.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--top 10] [--budget-ms 1500]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_providers  # noqa: E402
+
+SERVE = ("from app import create_app\n"
+         "from werkzeug.serving import make_server\n"
+         "make_server('127.0.0.1', {port}, create_app(warm_clients={warm}), threaded=True).serve_forever()\n")
+MODES = {
+    'eager': 'import clients\nclients.warm()\n',
+    'lazy': '',
+    'lazy+warm': '',
+}
+
+
+def environment(stub_url, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT, PROVIDERS='live',
+               GROQ_API_KEY='stub', OPENAI_API_KEY='stub', ELEVENLABS_API_KEY='stub',
+               GROQ_BASE_URL=stub_url, OPENAI_BASE_URL=f'{stub_url}/v1', ELEVENLABS_BASE_URL=stub_url,
+               JOBS_DB=f'{workdir}/jobs.db', AUDIO_CACHE_DIR=f'{workdir}/audio_cache', ASSET_DIR=f'{workdir}/assets',
+               ARCHIVE_DB=f'{workdir}/archive.db', IMAGE_CACHE_DIR=f'{workdir}/image_cache')
+    env.pop('PYTHONPROFILEIMPORTTIME', None)
+    return env
+
+
+def import_times(env, workdir):
+    """Return {module: cumulative microseconds} from one `python -X importtime -c 'import app'`"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], env=env, cwd=workdir,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = max(times.get(name.strip(), 0), int(cumulative))
+    return times
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        headers = {'Content-Type': 'application/json'} if body else {}
+        connection.request(method, path, body=json.dumps(body) if body else None, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def cold_start(mode, env, workdir):
+    """Spawn the app and return seconds until /metrics answers and until a first story returns"""
+    port = free_port()
+    script = MODES[mode] + SERVE.format(port=port, warm=mode == 'lazy+warm')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', script], env=env, cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'{mode} server exited with {process.returncode}')
+            try:
+                status = request(port, 'GET', '/metrics')
+                break
+            except ConnectionError:
+                time.sleep(0.002)
+        ready = time.perf_counter() - start
+        status = request(port, 'POST', '/generate_visual_story',
+                         {'description': f'A fox by a river {time.time()}', 'fresh': True})
+        if status != 200:
+            raise RuntimeError(f'{mode} first story failed with {status}')
+        return ready, time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--mode", choices=list(MODES), default='lazy', help="Mode checked against --budget-ms")
+    parser.add_argument("--budget-ms", type=float, default=0, help="Fail when the median first story is slower")
+    args = parser.parse_args()
+
+    stubs = stub_providers.start(latency=0)
+    workdir = tempfile.mkdtemp()
+    env = environment(f'http://127.0.0.1:{stubs.server_port}', workdir)
+
+    runs = [import_times(env, workdir) for _ in range(args.runs)]
+    median = {name: statistics.median(run.get(name, 0) for run in runs) for name in runs[0]}
+    print(f"import app: {median['app'] / 1000:.1f} ms (median of {args.runs})")
+    for name, micros in sorted(median.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    print(f"{'mode':>10} {'ready ms':>9} {'first story ms':>15}")
+    results = {}
+    for mode in MODES:
+        timings = [cold_start(mode, env, workdir) for _ in range(args.runs)]
+        ready = statistics.median(timing[0] for timing in timings) * 1000
+        results[mode] = statistics.median(timing[1] for timing in timings) * 1000
+        print(f"{mode:>10} {ready:>9.0f} {results[mode]:>15.0f}")
+
+    if args.budget_ms and results[args.mode] > args.budget_ms:
+        print(f"{args.mode} first story took {results[args.mode]:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
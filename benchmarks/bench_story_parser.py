@@ -0,0 +1,127 @@
+"""Fuzz and benchmark the story parser over recorded chat completions
+
+Checks that streaming the completions in random chunk sizes gives the same
+pairs as parsing them whole, that randomly mutated completions never raise
+or yield empty paragraphs or descriptions, and compares how many recorded
+completions the old parsers would have thrown away. Then reports throughput.
+
+Usage: python benchmarks/bench_story_parser.py [--mutations 2000] [--seed 1]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_parser import StoryStreamParser, parse_story  # noqa: E402
+
+COMPLETIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'completions.json')
+
+
+def legacy_line_parser(text):
+    """The line-by-line parser test.py used, indexing paragraphs by description"""
+    image_descriptions, paragraphs = [], []
+    for line in re.split('\n|\n\n', text):
+        if "Image Description:" in line:
+            image_descriptions.append(line[len('Image Description:'):].strip())
+        elif "Paragraph:" in line:
+            paragraphs.append(line[len('Paragraph:'):].strip())
+    return [(paragraphs[index], description) for index, description in enumerate(image_descriptions)]
+
+
+def streamed(text, rng):
+    parser = StoryStreamParser()
+    pairs = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        pairs.extend(parser.feed(text[position:position + size]))
+        position += size
+    return pairs + parser.close()
+
+
+def mutate(text, rng):
+    lines = text.split('\n')
+    for _ in range(rng.randint(1, 4)):
+        choice = rng.randrange(6)
+        index = rng.randrange(len(lines)) if lines else 0
+        if choice == 0 and lines:
+            del lines[index]
+        elif choice == 1 and lines:
+            lines.insert(index, lines[index])
+        elif choice == 2 and lines:
+            lines[index] = lines[index].upper() if rng.random() < 0.5 else lines[index].lower()
+        elif choice == 3 and lines:
+            lines[index] = rng.choice(['**', '### ', '- ', '1. ', '> ']) + lines[index]
+        elif choice == 4:
+            lines.insert(index, ''.join(rng.choice(':*\n #-Paragraphé—') for _ in range(rng.randint(0, 20))))
+        else:
+            cut = rng.randint(0, len(text))
+            lines = '\n'.join(lines)[:cut].split('\n')
+    return '\n'.join(lines)
+
+
+def check(pairs):
+    return all(paragraph and description for paragraph, description in pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mutations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=2000, help="Parses per completion for throughput")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with open(COMPLETIONS) as completions_file:
+        completions = json.load(completions_file)
+
+    failures = 0
+    legacy_failures = 0
+    for text in completions:
+        pairs = parse_story(text)
+        if streamed(text, rng) != pairs or not pairs or not check(pairs):
+            failures += 1
+        try:
+            if not legacy_line_parser(text):
+                legacy_failures += 1
+        except IndexError:
+            legacy_failures += 1
+    print(f"recorded: {len(completions)} completions, {failures} failed parses "
+          f"(old line parser: {legacy_failures} lost)")
+
+    fuzz_failures = 0
+    for _ in range(args.mutations):
+        text = mutate(rng.choice(completions), rng)
+        try:
+            pairs = parse_story(text)
+            if streamed(text, rng) != pairs or not check(pairs):
+                fuzz_failures += 1
+                print(f"  mismatch for {text!r}")
+        except Exception as e:
+            fuzz_failures += 1
+            print(f"  {type(e).__name__}: {e} for {text!r}")
+    print(f"fuzz: {args.mutations} mutations, {fuzz_failures} failures")
+
+    size = sum(len(text) for text in completions) * args.rounds
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for text in completions:
+            parse_story(text)
+    whole = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(args.rounds // 10):
+        for text in completions:
+            streamed(text, rng)
+    stream = (time.perf_counter() - start) * 10
+    print(f"throughput: whole {size / whole / 1e6:.1f} MB/s, streamed in 1-12 char chunks {size / stream / 1e6:.1f} MB/s")
+    if failures or fuzz_failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Peak memory of one /generate_description request for a large upload
+
+Compares the old save-to-disk path (save, read back, base64 str, f-string data
+URL) with the in-memory upload path, for bytes Pillow cannot decode (sent as
+they are) and for a JPEG photo (downscaled before encoding). Each mode runs in
+its own process with the app and Pillow already imported, and reports how far
+the request raised peak RSS, so import costs and earlier runs do not mix in.
+
+Usage: python benchmarks/bench_upload_memory.py [--size-mb 10]
+"""
+import argparse
+import base64
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("GROQ_API_KEY", "bench")
+
+
+class FakeVision:
+    def describe(self, image_url, prompt, model, timeout=None):
+        return 'A cartoon photo'
+
+
+def legacy_describe(image):
+    """The upload path before the in-memory rework"""
+    from werkzeug.utils import secure_filename
+    image_path = secure_filename(image.filename)
+    image.save(image_path)
+    with open(image_path, "rb") as image_file:
+        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+    description = FakeVision().describe(f"data:image/jpeg;base64,{base64_image}", None, None)
+    os.remove(image_path)
+    return description
+
+
+def write_payload(kind, size_mb, path):
+    """Write size_mb of random bytes, or a noisy JPEG photo of about that size"""
+    if kind == 'random':
+        payload = os.urandom(size_mb * 1024 * 1024)
+    else:
+        from PIL import Image
+        side = int((size_mb * 1024 * 1024 / 1.2) ** 0.5)
+        output = io.BytesIO()
+        Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(output, 'JPEG', quality=95)
+        payload = output.getvalue()
+    with open(path, 'wb') as payload_file:
+        payload_file.write(payload)
+
+
+def measure(mode, kind, path):
+    os.chdir(tempfile.mkdtemp())
+    import app
+    from PIL import Image  # noqa: F401
+    app.providers.vision = FakeVision()
+    with open(path, 'rb') as payload_file:
+        payload = payload_file.read()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    tracemalloc.start()
+    with app.app.test_request_context('/generate_description', method='POST', data={
+        'image': (io.BytesIO(payload), 'photo.jpg', 'image/jpeg')
+    }):
+        if mode == 'legacy':
+            legacy_describe(app.request.files['image'])
+        else:
+            app.generate_description()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{kind:>6} {len(payload) / 1024 / 1024:>5.1f} MB {mode:>9}: peak python allocations {peak / 1024 / 1024:6.1f} MB, "
+          f"peak RSS growth {rss - before:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=10)
+    parser.add_argument("--mode", choices=['legacy', 'streaming'])
+    parser.add_argument("--kind", choices=['random', 'jpeg'], default='random')
+    parser.add_argument("--payload", help="File holding the upload, written by the parent run")
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.kind, args.payload)
+        return
+    workdir = tempfile.mkdtemp()
+    for kind in ('random', 'jpeg'):
+        path = os.path.join(workdir, kind)
+        write_payload(kind, args.size_mb, path)
+        for mode in ('legacy', 'streaming'):
+            subprocess.run([sys.executable, __file__, '--mode', mode, '--kind', kind, '--payload', path], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Load test the app against local stub providers
+
+Starts the stub providers, serves the app with gunicorn (or the threaded
+development server with --server dev) and drives describe and story requests
+from concurrent clients, reporting requests/sec and latency percentiles.
+
+Usage: python benchmarks/load_test.py [--clients 16] [--requests 200] [--latency 0.2]
+"""
+import argparse
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_providers  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, seconds=30):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per stub provider call")
+    parser.add_argument("--server", choices=['gunicorn', 'dev'], default='gunicorn')
+    args = parser.parse_args()
+
+    stubs = stub_providers.start(latency=args.latency)
+    stub_url = f'http://127.0.0.1:{stubs.server_port}'
+    workdir = tempfile.mkdtemp()
+    port = free_port()
+    env = dict(os.environ, GROQ_API_KEY='stub', OPENAI_API_KEY='stub', ELEVENLABS_API_KEY='stub',
+               GROQ_BASE_URL=stub_url, OPENAI_BASE_URL=f'{stub_url}/v1', ELEVENLABS_BASE_URL=stub_url,
+               JOBS_DB=f'{workdir}/jobs.db',
+               IMAGE_CACHE_DIR=f'{workdir}/image_cache', ASSET_DIR=f'{workdir}/assets', BIND=f'127.0.0.1:{port}',
+               ARCHIVE_DB=f'{workdir}/archive.db', PYTHONPATH=ROOT,
+               # Every request comes from this one address, so the per-client limit would throttle the test itself
+               CLIENT_RATE_LIMIT='0')
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                   '--access-logfile', '/dev/null', 'wsgi:app']
+    else:
+        command = [sys.executable, '-c',
+                   f'from werkzeug.serving import run_simple; from app import app; '
+                   f'run_simple("127.0.0.1", {port}, app, threaded=True)']
+    server = subprocess.Popen(command, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    local = threading.local()
+    try:
+        wait_for(base + '/metrics')
+
+        def one(index):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            start = time.perf_counter()
+            # Unique bytes so the description cache does not short-circuit the vision call
+            image = io.BytesIO(b'\xff\xd8' + index.to_bytes(4, 'big') + b'\0' * 1024)
+            described = session.post(base + '/generate_description', files={'image': ('frame.jpg', image)})
+            describe_time = time.perf_counter() - start
+            # The stubs always describe the same scene, so fresh keeps the story cache from answering
+            story = session.post(base + '/generate_visual_story',
+                                 json={'description_id': described.json().get('description_id'), 'fresh': True})
+            ok = described.status_code == 200 and story.status_code == 200
+            return ok, describe_time, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            results = list(executor.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+        stubs.shutdown()
+
+    failures = sum(1 for ok, _, _ in results if not ok)
+    describe = [d for _, d, _ in results]
+    total = [t for _, _, t in results]
+    print(f"{args.server}: {len(results)} sessions from {args.clients} clients in {elapsed:.1f}s, {failures} failed")
+    print(f"  throughput {2 * len(results) / elapsed:.1f} requests/sec")
+    print(f"  describe  p50 {statistics.median(describe) * 1000:.0f} ms, p99 {percentile(describe, 0.99) * 1000:.0f} ms")
+    print(f"  session   p50 {statistics.median(total) * 1000:.0f} ms, p99 {percentile(total, 0.99) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
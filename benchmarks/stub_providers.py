@@ -0,0 +1,143 @@
+"""Local HTTP stand-ins for the Groq, OpenAI and Eleven Labs APIs
+
+Point the app at it with:
+  GROQ_BASE_URL=http://127.0.0.1:PORT OPENAI_BASE_URL=http://127.0.0.1:PORT/v1
+  ELEVENLABS_BASE_URL=http://127.0.0.1:PORT
+
+Faults can be injected to exercise retries, hedging and circuit breakers:
+--error-rate answers that share of calls with --error-status, --slow-rate
+holds that share for --slow-latency seconds, and setting `down` on the
+handler class of a running server fails every call. --capacity serves at
+most that many calls at once and queues the rest, like a saturated API.
+
+Usage: python benchmarks/stub_providers.py [--port 9090] [--latency 0.2]
+                                           [--error-rate 0.1] [--error-status 503]
+                                           [--slow-rate 0.05] [--slow-latency 10] [--capacity 8]
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Numbered per call, like FakeChat, so no two stories share image prompts
+STORY = (
+    "Paragraph: A small fox found a glowing stone by the river{take}.\n"
+    "Image Description: A cartoon fox holding a glowing stone beside a river{take}.\n\n"
+    "Paragraph: The stone showed the fox a path through the forest{take}.\n"
+    "Image Description: A bright trail of light winding between tall trees{take}.\n\n"
+    "Paragraph: At the end of the path, the fox found its family waiting{take}.\n"
+    "Image Description: A family of foxes greeting each other at sunset{take}."
+)
+# 1x1 transparent PNG
+PNG = base64.b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360606060000000050001a5f645400000000049454e44ae426082'
+)).decode('ascii')
+MP3 = b'ID3' + b'\0' * 4093
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.2
+    error_rate = 0.0
+    error_status = 503
+    slow_rate = 0.0
+    slow_latency = 10.0
+    down = False
+    slots = None
+    takes = 0
+    takes_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            # The client gave up first, e.g. after its own timeout
+            pass
+
+    def _send(self, body, content_type='application/json', status=200, headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        roll = random.random()
+        if self.down or roll < self.error_rate:
+            time.sleep(self.latency)
+            headers = {'Retry-After': '1'} if self.error_status == 429 else None
+            self._send({'error': {'message': 'Injected stub fault', 'type': 'server_error'}},
+                       status=self.error_status, headers=headers)
+            return
+        delay = self.slow_latency if roll < self.error_rate + self.slow_rate else self.latency
+        if self.slots:
+            with self.slots:
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+        if self.path.endswith('/chat/completions'):
+            vision = isinstance(request['messages'][0].get('content'), list)
+            if vision:
+                content = 'A cartoon fox sitting by a sparkling river.'
+            else:
+                with self.takes_lock:
+                    StubHandler.takes += 1
+                    content = STORY.format(take=f' (take {StubHandler.takes})')
+            self._send({
+                'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': request.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': 50, 'completion_tokens': 120, 'total_tokens': 170}
+            })
+        elif self.path.endswith('/images/generations'):
+            self._send({'created': int(time.time()), 'data': [{'b64_json': PNG}]})
+        elif '/text-to-speech/' in self.path:
+            self._send(MP3, 'audio/mpeg')
+        else:
+            self.send_error(404)
+
+
+def start(port=0, latency=0.2, error_rate=0.0, error_status=503, slow_rate=0.0, slow_latency=10.0, capacity=0):
+    """Serve the stubs on a background thread and return the server"""
+    handler = type('Handler', (StubHandler,), {
+        'latency': latency, 'error_rate': error_rate, 'error_status': error_status,
+        'slow_rate': slow_rate, 'slow_latency': slow_latency,
+        'slots': threading.Semaphore(capacity) if capacity else None
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    parser.add_argument("--capacity", type=int, default=0)
+    args = parser.parse_args()
+    server = start(args.port, args.latency, args.error_rate, args.error_status, args.slow_rate, args.slow_latency,
+                   args.capacity)
+    print(f"Stub providers on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
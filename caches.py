@@ -0,0 +1,503 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread safe in-memory LRU cache with entry count and TTL eviction"""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DescriptionCache:
+    """Image descriptions keyed by a hash of the image bytes, model and prompt
+
+    Lookups go to an in-memory LRU first and then to an optional SQLite file
+    shared by every worker process.
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, db_path=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS descriptions '
+                    '(key TEXT PRIMARY KEY, description TEXT NOT NULL, created_at REAL NOT NULL)'
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key(image_bytes, model, prompt):
+        digest = hashlib.sha256(image_bytes)
+        digest.update(b'\0' + model.encode('utf-8') + b'\0' + prompt.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached description, or None"""
+        description = self.memory.get(key)
+        if description is not None:
+            self.hits += 1
+            return description
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT description FROM descriptions WHERE key = ? AND created_at > ?',
+                    (key, time.time() - self.ttl if self.ttl else 0)
+                ).fetchone()
+            if row:
+                self.disk_hits += 1
+                self.memory.set(key, row[0])
+                return row[0]
+        self.misses += 1
+        return None
+
+    def set(self, key, description):
+        self.memory.set(key, description)
+        if self.db_path:
+            with self._connect() as conn:
+                now = time.time()
+                conn.execute(
+                    'INSERT OR REPLACE INTO descriptions (key, description, created_at) VALUES (?, ?, ?)',
+                    (key, description, now)
+                )
+                if self.ttl:
+                    conn.execute('DELETE FROM descriptions WHERE created_at <= ?', (now - self.ttl,))
+
+    def clear(self):
+        self.memory.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM descriptions')
+
+    def stats(self):
+        return {
+            'entries': len(self.memory),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses
+        }
+
+
+class StoryCache:
+    """Finished stories keyed by description, prompt template and model settings
+
+    Stories are stored as JSON with their paragraphs and image asset keys,
+    in memory first and then in an optional SQLite file shared by every
+    worker process.
+    """
+
+    def __init__(self, max_entries=256, ttl=86400, db_path=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS stories '
+                    '(key TEXT PRIMARY KEY, story TEXT NOT NULL, created_at REAL NOT NULL)'
+                )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key(description, template, params):
+        return hashlib.sha256(json.dumps([description, template, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached story dict, or None"""
+        story = self.memory.get(key)
+        if story is not None:
+            self.hits += 1
+            return json.loads(story)
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT story FROM stories WHERE key = ? AND created_at > ?',
+                    (key, time.time() - self.ttl if self.ttl else 0)
+                ).fetchone()
+            if row:
+                self.disk_hits += 1
+                self.memory.set(key, row[0])
+                return json.loads(row[0])
+        self.misses += 1
+        return None
+
+    def set(self, key, story):
+        # Kept serialized so callers cannot change the cached copy
+        story = json.dumps(story)
+        self.memory.set(key, story)
+        if self.db_path:
+            with self._connect() as conn:
+                now = time.time()
+                conn.execute(
+                    'INSERT OR REPLACE INTO stories (key, story, created_at) VALUES (?, ?, ?)',
+                    (key, story, now)
+                )
+                if self.ttl:
+                    conn.execute('DELETE FROM stories WHERE created_at <= ?', (now - self.ttl,))
+
+    def clear(self):
+        self.memory.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM stories')
+
+    def stats(self):
+        return {
+            'entries': len(self.memory),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses
+        }
+
+
+def normalize_prompt(prompt):
+    """Lowercase a prompt and drop punctuation and repeated whitespace"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', prompt.lower()).split())
+
+
+class ImageCache:
+    """Generated images stored as files on disk with a SQLite index
+
+    Entries are keyed on the normalized prompt, size, n and model and evicted
+    least recently used first once the files exceed max_bytes. With a
+    similarity threshold, prompts whose word sets overlap at least that much
+    (Jaccard) reuse an existing image.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024, similarity=0, candidates=500):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.similarity = similarity
+        self.candidates = candidates
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, 'index.db')
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS images (key TEXT PRIMARY KEY, prompt TEXT NOT NULL, '
+                'size TEXT NOT NULL, n INTEGER NOT NULL, model TEXT NOT NULL, bytes INTEGER NOT NULL, '
+                'last_used REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS images_last_used ON images (last_used)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key(prompt, size, n, model):
+        return hashlib.sha256(f'{normalize_prompt(prompt)}|{size}|{n}|{model}'.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.png')
+
+    def _read(self, conn, key):
+        try:
+            with open(self._path(key), 'rb') as image_file:
+                data = image_file.read()
+        except FileNotFoundError:
+            conn.execute('DELETE FROM images WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE images SET last_used = ? WHERE key = ?', (time.time(), key))
+        return data
+
+    def _similar_key(self, conn, prompt, size, n, model):
+        words = set(normalize_prompt(prompt).split())
+        if not words:
+            return None
+        rows = conn.execute(
+            'SELECT key, prompt FROM images WHERE size = ? AND n = ? AND model = ? '
+            'ORDER BY last_used DESC LIMIT ?',
+            (size, n, model, self.candidates)
+        ).fetchall()
+        best_key, best_score = None, self.similarity
+        for key, other in rows:
+            other_words = set(other.split())
+            score = len(words & other_words) / len(words | other_words)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, prompt, size, n, model):
+        """Return the cached PNG bytes for a prompt, or None"""
+        key = self.key(prompt, size, n, model)
+        with self._connect() as conn:
+            data = self._read(conn, key)
+            if data is not None:
+                self.hits += 1
+                return data
+            if self.similarity:
+                similar = self._similar_key(conn, prompt, size, n, model)
+                data = self._read(conn, similar) if similar else None
+                if data is not None:
+                    self.similar_hits += 1
+                    return data
+        self.misses += 1
+        return None
+
+    def set(self, prompt, size, n, model, data):
+        """Store PNG bytes for a prompt and evict old images over the byte budget"""
+        key = self.key(prompt, size, n, model)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a private file first so readers never see a partial image
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as image_file:
+            image_file.write(data)
+        os.replace(temp_path, path)
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO images (key, prompt, size, n, model, bytes, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, normalize_prompt(prompt), size, n, model, len(data), time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM images').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute('SELECT key, bytes FROM images ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM images WHERE key = ?', (key,))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def purge(self):
+        """Delete every cached image"""
+        with self._connect() as conn:
+            for (key,) in conn.execute('SELECT key FROM images').fetchall():
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            conn.execute('DELETE FROM images')
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM images').fetchone()
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses
+        }
+
+
+class FileStore:
+    """Files sharded by key prefix under a directory, oldest removed first over a byte budget"""
+
+    extensions = ()
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Running total so the directory is only walked when over budget
+        self.total = sum(os.path.getsize(path) for path in self._files())
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a private file first so readers never see a partial file
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as output:
+            output.write(data)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.total += len(data)
+            over_budget = self.total > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(self.extensions):
+                    yield os.path.join(root, name)
+
+    def _evict(self):
+        with self.lock:
+            files = [(os.stat(path), path) for path in self._files()]
+            total = sum(stat.st_size for stat, _ in files)
+            for stat, path in sorted(files, key=lambda item: item[0].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= stat.st_size
+            self.total = total
+
+    def purge(self):
+        for path in list(self._files()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self.lock:
+            self.total = 0
+
+    def stats(self):
+        sizes = [os.path.getsize(path) for path in self._files()]
+        return {
+            'entries': len(sizes),
+            'bytes': sum(sizes),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class AudioCache(FileStore):
+    """Synthesized audio segments stored as content-addressed MP3 files
+
+    Files are named by a hash of the text, voice id and voice settings and
+    the oldest are removed once the directory exceeds max_bytes.
+    """
+
+    extensions = ('.mp3',)
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def key(text, voice_id, voice_settings):
+        return hashlib.sha256(json.dumps([text, voice_id, voice_settings], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.mp3')
+
+    def contains(self, key):
+        try:
+            # Count the reuse as recent so eviction keeps the segment
+            os.utime(self.path(key))
+            self.hits += 1
+            return True
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+
+    def set(self, key, data):
+        self._write(self.path(key), data)
+
+
+class AssetStore(FileStore):
+    """Story images stored once as files named by a hash of their bytes
+
+    A URL built from the key always names the same image, so clients may
+    cache it forever. Variants such as a WebP copy or a thumbnail sit beside
+    the original as <key>.<variant> and are written on first request.
+    """
+
+    extensions = ('.png', '.webp')
+    # File suffix of each variant
+    variants = {'png': '.png', 'webp': '.webp', 'thumb': '.thumb.webp'}
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def key(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, key, variant='png'):
+        return os.path.join(self.directory, key[:2], key + self.variants[variant])
+
+    def put(self, data):
+        """Store image bytes unless the same image is already stored, and return its key"""
+        key = self.key(data)
+        path = self.path(key)
+        try:
+            # Count the reuse as recent so eviction keeps the image
+            os.utime(path)
+            self.hits += 1
+        except FileNotFoundError:
+            self.misses += 1
+            self._write(path, data)
+        return key
+
+    def set_variant(self, key, variant, data):
+        self._write(self.path(key, variant), data)
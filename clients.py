@@ -0,0 +1,85 @@
+import importlib
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connection pool and timeout settings shared by every provider client; retries are
+# left to the resilience layer so the SDKs do not retry on their own
+pool_size = int(os.getenv("HTTP_POOL_SIZE", "32"))
+keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _shared(name, factory):
+    """Build a client once per process and hand the same instance to every request"""
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+# The SDKs take most of the app's import time, so each is imported the first time its
+# client is built rather than when the app starts
+SDK_MODULES = ('httpx', 'groq', 'openai', 'requests')
+
+
+def warm():
+    """Import the provider SDKs ahead of the first call that needs them"""
+    for name in SDK_MODULES:
+        importlib.import_module(name)
+
+
+def _httpx_client():
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                            keepalive_expiry=keepalive_expiry),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        follow_redirects=True
+    )
+
+
+def groq_client():
+    """Shared Groq client with a pooled keep-alive HTTP connection"""
+    from groq import Groq
+
+    return _shared('groq', lambda: Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=_httpx_client(),
+                                        max_retries=0))
+
+
+def openai_client():
+    """Shared OpenAI client with a pooled keep-alive HTTP connection"""
+    from openai import OpenAI
+
+    return _shared('openai', lambda: OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=_httpx_client(),
+                                            max_retries=0))
+
+
+def http_session():
+    """Shared requests session for plain HTTP APIs such as Eleven Labs"""
+    def build():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    return _shared('http', build)
+
+
+def timeout(read=None):
+    """(connect, read) timeout for requests calls, with an optional shorter read timeout"""
+    return (connect_timeout, min(read, read_timeout) if read else read_timeout)
@@ -0,0 +1,181 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per `per` seconds, shared across threads"""
+
+    def __init__(self, rate, per=60.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed"""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.per / self.rate
+            time.sleep(wait)
+
+
+class SingleFlight:
+    """Share one execution of a call between concurrent callers asking for the same key
+
+    Only calls in flight are shared; once the leader finishes, the next
+    caller with that key starts a new execution.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+        self.lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (future, leader), where a leader gets a new future to resolve and must then end() the key"""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self.calls[key] = Future()
+            return future, True
+
+    def end(self, key, future):
+        """Stop sharing a leader's future, failing it for its followers if it was never resolved"""
+        with self.lock:
+            del self.calls[key]
+        if not future.done():
+            future.set_exception(RuntimeError('The shared call stopped before it finished'))
+
+    def do(self, key, func, *args):
+        """Return (func(*args), shared), where shared is True when another caller's run was reused"""
+        future, leader = self.begin(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = func(*args)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self.end(key, future)
+
+
+class Speculator:
+    """Run work ahead of a request that may never come, under a cap on unclaimed runs
+
+    start() begins func(*args, cancelled) in the background under a key unless
+    max_pending unclaimed runs are already outstanding; claim() hands the
+    future to the request that arrives for it, unless the run is still queued
+    behind other speculative work, which the request can do sooner itself.
+    Runs left unclaimed for ttl
+    seconds are dropped: queued ones are cancelled and running ones see
+    cancelled set, so they can skip their remaining steps.
+    """
+
+    def __init__(self, max_pending=8, ttl=120.0, max_workers=2):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='speculate')
+        self.runs = {}
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        for key, (future, started, cancelled) in list(self.runs.items()):
+            if now - started > self.ttl:
+                del self.runs[key]
+                cancelled.set()
+                future.cancel()
+                metrics.speculations.inc(outcome='expired')
+
+    def start(self, key, func, *args):
+        """Start func(*args, cancelled) under key; False when already running or over the cap"""
+        with self.lock:
+            now = time.monotonic()
+            self._expire(now)
+            if key in self.runs:
+                return False
+            if len(self.runs) >= self.max_pending:
+                metrics.speculations.inc(outcome='capped')
+                return False
+            cancelled = threading.Event()
+            self.runs[key] = (submit(self.executor, func, *args, cancelled), now, cancelled)
+        metrics.speculations.inc(outcome='started')
+        return True
+
+    def claim(self, key):
+        """Take the future of the run started under key, or None when there is none or it had not started"""
+        with self.lock:
+            self._expire(time.monotonic())
+            run = self.runs.pop(key, None)
+        if run is None:
+            return None
+        if run[0].cancel():
+            metrics.speculations.inc(outcome='unstarted')
+            return None
+        metrics.speculations.inc(outcome='claimed')
+        return run[0]
+
+    def pending(self):
+        with self.lock:
+            return len(self.runs)
+
+
+def submit(executor, func, *args):
+    """Submit func(*args) to run in a copy of the caller's context, so request deadlines carry over"""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def run_task(func, item, retries=0, limiter=None):
+    """Call func(item) with its own retries and timing"""
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            if limiter:
+                limiter.acquire()
+            result = func(item)
+            return {'result': result, 'error': None, 'attempts': attempts,
+                    'elapsed': time.perf_counter() - start}
+        except Exception as e:
+            if attempts > retries:
+                logger.error(f"Task failed after {attempts} attempts: {str(e)}")
+                return {'result': None, 'error': str(e), 'attempts': attempts,
+                        'elapsed': time.perf_counter() - start}
+            logger.info(f"Retrying task after error: {str(e)}")
+
+
+def run_ordered(func, items, max_workers=4, retries=0, limiter=None):
+    """Run func over items with at most max_workers in flight, keeping input order
+
+    Each item fails or retries on its own; the returned list holds one dict per
+    item with 'result', 'error', 'attempts' and 'elapsed' (seconds).
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [submit(executor, run_task, func, item, retries, limiter) for item in items]
+        return [future.result() for future in futures]
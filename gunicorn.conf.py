@@ -0,0 +1,35 @@
+import os
+
+# Threaded workers: requests spend most of their time waiting on provider APIs
+bind = os.getenv("BIND", "0.0.0.0:8080")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("WEB_THREADS", "16"))
+# Story generation waits on a chat completion plus several image calls
+timeout = int(os.getenv("WEB_TIMEOUT", "180"))
+graceful_timeout = 30
+keepalive = 5
+# Each worker imports the app itself so its job threads and connection pools are not shared across fork
+preload_app = False
+accesslog = "-"
+
+if workers > 1:
+    # Description ids must resolve in whichever worker serves the story request, client buckets and
+    # provider slots must be counted across workers, and a /metrics scrape must see every worker
+    os.environ.setdefault("STATE_STORE", "sqlite:///state.db")
+    os.environ.setdefault("ADMISSION_STORE", "sqlite:///admission.db")
+    os.environ.setdefault("METRICS_DIR", "metrics")
+    for name in ("STATE_STORE", "ADMISSION_STORE"):
+        if os.environ[name] == "memory":
+            raise RuntimeError(f"{name}=memory is per process; use a shared store with more than one worker")
+    if not os.environ["METRICS_DIR"]:
+        raise RuntimeError("METRICS_DIR must be set with more than one worker")
+
+
+def on_starting(server):
+    # Worker snapshots from an earlier run would otherwise be added to this one's metrics
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith(('.json', '.json.tmp')):
+                os.remove(os.path.join(metrics_dir, name))
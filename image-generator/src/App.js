@@ -2,10 +2,32 @@ import React, { useState } from 'react';
 import axios from 'axios';
 import './App.css';
 
+// Append a streamed MP3 response to a MediaSource as it arrives; resolves once all of it is buffered
+const feedMediaSource = (mediaSource, response) => new Promise((resolve, reject) => {
+  mediaSource.addEventListener('sourceopen', async () => {
+    try {
+      const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+      const reader = response.body.getReader();
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        const appended = new Promise(next => sourceBuffer.addEventListener('updateend', next, { once: true }));
+        sourceBuffer.appendBuffer(value);
+        await appended;
+      }
+      mediaSource.endOfStream();
+      resolve();
+    } catch (err) {
+      reject(err);
+    }
+  }, { once: true });
+});
+
 function App() {
   const [selectedImage, setSelectedImage] = useState(null);
   const [previewUrl, setPreviewUrl] = useState(null);
   const [description, setDescription] = useState('');
+  const [descriptionId, setDescriptionId] = useState(null);
   const [storyData, setStoryData] = useState(null);
   const [loading, setLoading] = useState(false);
   const [loadingProgress, setLoadingProgress] = useState('');
@@ -18,6 +40,7 @@ function App() {
       setSelectedImage(file);
       setPreviewUrl(URL.createObjectURL(file));
       setDescription('');
+      setDescriptionId(null);
       setStoryData(null);
       setError(null);
     }
@@ -39,6 +62,7 @@ function App() {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
       setDescription(response.data.description);
+      setDescriptionId(response.data.description_id);
     } catch (err) {
       setError('Error generating description: ' + err.message);
     } finally {
@@ -53,24 +77,56 @@ function App() {
       return;
     }
 
+    // Asking again for the same description means the user wants a different story
+    const fresh = storyData !== null;
     setLoading(true);
     setLoadingProgress('Generating visual story...');
+    setStoryData(null);
 
     try {
-      const response = await axios.post('http://localhost:8080/generate_visual_story', {
-        prompt: description
+      const response = await fetch('http://localhost:8080/generate_visual_story/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ description_id: descriptionId, description, fresh })
       });
+      if (!response.ok) {
+        const body = await response.json();
+        throw new Error(body.error || 'Failed to generate story');
+      }
 
-      console.log('Story Response:', response.data);
-
-      if (response.data.success && response.data.story_data) {
-        setStoryData(response.data.story_data);
-      } else {
-        throw new Error('Failed to generate story');
+      // Read Server-Sent Events, updating the story as each paragraph and image arrives
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || 'null');
+          if (event === 'paragraph') {
+            setStoryData(prev => {
+              const next = [...(prev || [])];
+              next[data.index] = { ...next[data.index], paragraph: data.paragraph, description: data.description };
+              return next;
+            });
+          } else if (event === 'image') {
+            setStoryData(prev => {
+              const next = [...(prev || [])];
+              next[data.index] = { ...next[data.index], url: data.url, webpUrl: data.webp_url, error: data.error };
+              return next;
+            });
+          } else if (event === 'error') {
+            throw new Error(data.error);
+          }
+        }
       }
     } catch (err) {
       console.error('Story generation error:', err);
-      setError('Error generating story: ' + (err.response?.data?.error || err.message));
+      setError('Error generating story: ' + err.message);
     } finally {
       setLoading(false);
       setLoadingProgress('');
@@ -84,15 +140,39 @@ function App() {
     setLoadingProgress('Playing audio...');
 
     try {
-      // Construct the story text from all paragraphs
-      const story_text = storyData.map(segment => segment.paragraph).join(' ');
-      
-      const response = await axios.post('http://localhost:8080/hear_story', {
-        story_text: story_text
+      // Send the paragraphs separately so each one is narrated and cached on its own
+      const paragraphs = storyData.map(segment => segment.paragraph);
+
+      // The server streams the narration back as MP3 and the browser plays it
+      const response = await fetch('http://localhost:8080/hear_story', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ paragraphs: paragraphs })
       });
 
-      if (!response.data.success) {
-        throw new Error('Failed to play audio');
+      if (!response.ok) {
+        const body = await response.json();
+        throw new Error(body.error || 'Failed to play audio');
+      }
+
+      // Play the first paragraph while the rest is still being narrated where MediaSource
+      // takes MP3, otherwise wait for the whole narration
+      let audioUrl;
+      let buffered = Promise.resolve();
+      if (window.MediaSource && MediaSource.isTypeSupported('audio/mpeg') && response.body) {
+        const mediaSource = new MediaSource();
+        audioUrl = URL.createObjectURL(mediaSource);
+        buffered = feedMediaSource(mediaSource, response);
+      } else {
+        audioUrl = URL.createObjectURL(await response.blob());
+      }
+      const audio = new Audio(audioUrl);
+      const ended = new Promise(resolve => { audio.onended = resolve; });
+      try {
+        await Promise.all([audio.play(), buffered, ended]);
+      } finally {
+        audio.pause();
+        URL.revokeObjectURL(audioUrl);
       }
     } catch (err) {
       setError('Error playing audio: ' + err.message);
@@ -180,10 +260,11 @@ function App() {
               {storyData.map((segment, index) => (
                 <div key={index} className={`story-segment ${index % 2 === 1 ? 'reverse' : ''}`}>
                   <div className="story-image">
-                    {segment.data && (
+                    {segment.url && (
                       <img 
-                        src={`data:image/jpeg;base64,${segment.data}`}
+                        src={`http://localhost:8080${segment.webpUrl || segment.url}`}
                         alt={`Story scene ${index + 1}`}
+                        loading="lazy"
                         onError={(e) => {
                           console.error('Image loading error for segment:', index, e);
                           e.target.src = 'placeholder.png';
@@ -0,0 +1,176 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT,
+    payload TEXT NOT NULL,
+    input BLOB,
+    result TEXT,
+    audio BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+'''
+
+
+class JobStore:
+    """SQLite backed job state, safe to share between threads and processes"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, payload, input_bytes=None):
+        """Queue a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, stage, payload, input, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', None, json.dumps(payload), input_bytes, now, now)
+            )
+        return job_id
+
+    def claim(self, lease=None):
+        """Mark the oldest queued job as running and return it, or None
+
+        With a lease, a running job not updated for that many seconds is
+        taken as abandoned by a dead worker and claimed again.
+        """
+        # Jobs in the future are never stale, so without a lease only queued jobs match
+        stale = time.time() - lease if lease else 0
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, status FROM jobs WHERE status = 'queued' OR (status = 'running' AND updated_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (stale,)
+                ).fetchone()
+                if row is None:
+                    return None
+                # Another worker may have claimed it between the select and the update
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = ? "
+                    "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND updated_at < ?))",
+                    (time.time(), row['id'], stale)
+                ).rowcount
+                if claimed:
+                    if row['status'] == 'running':
+                        logger.info(f"Job {row['id']} lost its worker, running it again")
+                    conn.commit()
+                    return conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+
+    def update(self, job_id, **fields):
+        """Set columns on a job, or only renew its lease when none are given"""
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id):
+        """Return the job row without its blobs, or None"""
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT id, status, stage, result, error, created_at, updated_at, '
+                'audio IS NOT NULL AS has_audio FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+
+    def get_audio(self, job_id):
+        """Return the job's audio bytes, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT audio FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row['audio'] if row else None
+
+
+class JobQueue:
+    """Pool of worker threads running queued jobs from a JobStore
+
+    runner(payload, input_bytes, set_stage) must return (result, audio_bytes).
+    A running job renews its lease every lease / 3 seconds; one that goes
+    lease seconds without it is picked up again by another worker.
+    """
+
+    def __init__(self, store, runner, workers=2, poll_interval=0.5, lease=60.0):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.wakeup = threading.Event()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads once"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True).start()
+        logger.info(f"Started {self.workers} job workers")
+
+    def submit(self, payload, input_bytes=None):
+        """Persist a job, wake a worker and return the job id"""
+        self.start()
+        job_id = self.store.create(payload, input_bytes)
+        self.wakeup.set()
+        return job_id
+
+    def _work(self):
+        while True:
+            job = self.store.claim(self.lease)
+            if job is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+
+        def set_stage(stage):
+            self.store.update(job_id, stage=stage)
+
+        def heartbeat():
+            while not finished.wait(self.lease / 3):
+                self.store.update(job_id)
+
+        finished = threading.Event()
+        if self.lease:
+            threading.Thread(target=heartbeat, name=f'job-heartbeat-{job_id[:8]}', daemon=True).start()
+        try:
+            result, audio = self.runner(json.loads(job['payload']), job['input'], set_stage)
+            self.store.update(job_id, status='done', stage=None, result=json.dumps(result),
+                              audio=audio, input=None)
+        except Exception as e:
+            logger.error(f"Error in job {job_id}: {str(e)}")
+            self.store.update(job_id, status='failed', error=str(e), input=None)
+        finally:
+            finished.set()
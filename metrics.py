@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer(__name__)
+except ImportError:
+    tracer = None
+
+# Share of requests whose raw payloads are dumped to the log, 0 disables dumps
+debug_dump_rate = float(os.getenv("DEBUG_DUMP_RATE", "0"))
+# With several worker processes each one publishes its metrics here, and /metrics merges them all
+metrics_dir = os.getenv("METRICS_DIR", "")
+publish_interval = float(os.getenv("METRICS_PUBLISH_SECONDS", "1"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+BYTE_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2)
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def fresh(self):
+        return Counter(self.name, self.help, self.labels)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, snapshot):
+        with self.lock:
+            for key, value in snapshot:
+                self.values[tuple(key)] = self.values.get(tuple(key), 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_label_text(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket histogram with labels, in the Prometheus exposition format"""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def fresh(self):
+        return Histogram(self.name, self.help, self.labels, self.buckets)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), list(counts), count, total] for key, (counts, count, total) in self.series.items()]
+
+    def merge(self, snapshot):
+        with self.lock:
+            for key, counts, count, total in snapshot:
+                series = self.series.setdefault(tuple(key), [[0] * len(self.buckets), 0, 0.0])
+                series[0] = [mine + theirs for mine, theirs in zip(series[0], counts)]
+                series[1] += count
+                series[2] += total
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labels + ('le',)
+        with self.lock:
+            for key, (counts, count, total) in sorted(self.series.items()):
+                for bound, bucket in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_label_text(names, key + (bound,))} {bucket}')
+                lines.append(f'{self.name}_bucket{_label_text(names, key + ("+Inf",))} {count}')
+                lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {total}')
+                lines.append(f'{self.name}_count{_label_text(self.labels, key)} {count}')
+        return lines
+
+
+stage_seconds = Histogram('imagetales_stage_seconds', 'Time spent in each pipeline stage', ('stage',))
+stage_errors = Counter('imagetales_stage_errors_total', 'Pipeline stage failures', ('stage',))
+stage_bytes = Histogram('imagetales_stage_bytes', 'Payload sizes per pipeline stage',
+                        ('stage', 'direction'), buckets=BYTE_BUCKETS)
+tokens = Counter('imagetales_tokens_total', 'Tokens used per model', ('model', 'kind'))
+request_seconds = Histogram('imagetales_http_request_seconds', 'HTTP request latency', ('route', 'method', 'status'))
+provider_retries = Counter('imagetales_provider_retries_total', 'Provider calls retried after a fault', ('provider',))
+provider_hedges = Counter('imagetales_provider_hedges_total', 'Duplicate requests sent for slow provider calls',
+                          ('provider',))
+provider_rejections = Counter('imagetales_provider_rejections_total',
+                              'Provider calls refused while the circuit is open', ('provider',))
+admission_rejections = Counter('imagetales_admission_rejections_total', 'Requests turned away with 429',
+                               ('reason',))
+admission_wait_seconds = Histogram('imagetales_admission_wait_seconds', 'Time requests queued for a provider slot',
+                                   ('pool',))
+speculations = Counter('imagetales_speculations_total',
+                       'Stories started before they were requested, and whether they were used', ('outcome',))
+
+REGISTRY = [stage_seconds, stage_errors, stage_bytes, tokens, request_seconds,
+            provider_retries, provider_hedges, provider_rejections, admission_rejections, admission_wait_seconds,
+            speculations]
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage, count its failures and wrap it in a span when OpenTelemetry is installed"""
+    start = time.perf_counter()
+    span = tracer.start_as_current_span(f'imagetales.{name}') if tracer else None
+    try:
+        if span:
+            with span:
+                yield
+        else:
+            yield
+    except Exception:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+
+
+def record_bytes(stage_name, direction, size):
+    stage_bytes.observe(size, stage=stage_name, direction=direction)
+
+
+def record_usage(model, usage):
+    """Count prompt and completion tokens from an API usage object"""
+    if usage is None:
+        return
+    tokens.inc(getattr(usage, 'prompt_tokens', 0) or 0, model=model, kind='prompt')
+    tokens.inc(getattr(usage, 'completion_tokens', 0) or 0, model=model, kind='completion')
+
+
+def debug_sampled():
+    """True for the sampled share of calls that may dump raw payloads"""
+    return debug_dump_rate > 0 and random.random() < debug_dump_rate
+
+
+def publish():
+    """Write this process's metrics to METRICS_DIR for the other workers to merge"""
+    path = os.path.join(metrics_dir, f'{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as snapshot_file:
+        json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, snapshot_file)
+    # Readers see either the old snapshot or the new one, never half of it
+    os.replace(f'{path}.tmp', path)
+
+
+def _publish_forever():
+    while True:
+        time.sleep(publish_interval)
+        try:
+            publish()
+        except OSError:
+            pass
+
+
+def collect():
+    """Every worker's metrics added together, from the snapshots in METRICS_DIR
+
+    Snapshots of workers that have exited are kept, so counters never go
+    backwards when a worker is replaced.
+    """
+    publish()
+    merged = [metric.fresh() for metric in REGISTRY]
+    for name in os.listdir(metrics_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, name)) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        for metric in merged:
+            metric.merge(snapshot.get(metric.name, []))
+    return merged
+
+
+def render():
+    """All metrics in the Prometheus text exposition format, across workers when METRICS_DIR is set"""
+    lines = []
+    for metric in collect() if metrics_dir else REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+if metrics_dir:
+    os.makedirs(metrics_dir, exist_ok=True)
+    threading.Thread(target=_publish_forever, name='metrics-publish', daemon=True).start()
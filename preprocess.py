@@ -0,0 +1,120 @@
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Largest side, output format and quality sent to each vision model
+VISION_PROFILES = {
+    'llava-v1.5-7b-4096-preview': {'max_side': 672, 'format': 'JPEG', 'quality': 85},
+}
+DEFAULT_PROFILE = {'max_side': 1024, 'format': 'JPEG', 'quality': 85}
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png'}
+
+# Largest side, format and quality of the variants served for story images
+IMAGE_VARIANTS = {
+    'webp': {'max_side': 1024, 'format': 'WEBP', 'quality': 80},
+    'thumb': {'max_side': 256, 'format': 'WEBP', 'quality': 75},
+}
+
+
+def vision_profile(model):
+    """Return the preprocessing settings for a model, with environment overrides"""
+    profile = dict(VISION_PROFILES.get(model, DEFAULT_PROFILE))
+    if os.getenv("VISION_MAX_SIDE"):
+        profile['max_side'] = int(os.getenv("VISION_MAX_SIDE"))
+    if os.getenv("VISION_FORMAT"):
+        profile['format'] = os.getenv("VISION_FORMAT").upper()
+    if os.getenv("VISION_QUALITY"):
+        profile['quality'] = int(os.getenv("VISION_QUALITY"))
+    return profile
+
+
+def prepare_image(image_bytes, max_side=1024, format='JPEG', quality=85):
+    """Orient, downscale and re-encode an image for a vision model
+
+    Returns (bytes, mime_type), or None when the original should be sent as
+    is because it cannot be decoded or is already small, upright and would not
+    shrink. JPEGs are decoded at a reduced scale when possible.
+    """
+    # Pillow is imported on first use to keep it off the startup path
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original_format = image.format
+        original_size = image.size
+        upright = image.getexif().get(0x0112, 1) == 1
+        if original_format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale while staying above max_side
+            image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, format=format, quality=quality, optimize=True)
+    except Exception as e:
+        logger.info(f"Sending image unprocessed: {str(e)}")
+        return None
+
+    if upright and max(original_size) <= max_side and output.tell() >= len(image_bytes):
+        return None
+    return output.getvalue(), MIME_TYPES[format]
+
+
+def image_variant(image_bytes, max_side=1024, format='WEBP', quality=80):
+    """Downscale and re-encode a stored image for serving, or None if it cannot be decoded"""
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=format, quality=quality)
+    except Exception as e:
+        logger.info(f"Could not render image variant: {str(e)}")
+        return None
+    return output.getvalue()
+
+
+def perceptual_hash(image_bytes, hash_size=8):
+    """Difference hash of an image as an int, or None if it cannot be decoded"""
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft('L', (hash_size * 8, hash_size * 8))
+        image = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    except Exception as e:
+        logger.info(f"Could not hash image: {str(e)}")
+        return None
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            left = pixels[row * (hash_size + 1) + column]
+            right = pixels[row * (hash_size + 1) + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def distinct_frames(frames, max_distance=6):
+    """Return the indexes of frames that differ from the previous kept frame
+
+    Frames are compared by perceptual hash, so near-duplicate consecutive
+    frames of the same scene are dropped. Frames that cannot be hashed are kept.
+    """
+    kept = []
+    previous = None
+    for index, frame in enumerate(frames):
+        frame_hash = perceptual_hash(frame)
+        if frame_hash is not None and previous is not None \
+                and bin(frame_hash ^ previous).count('1') <= max_distance:
+            continue
+        kept.append(index)
+        if frame_hash is not None:
+            previous = frame_hash
+    return kept
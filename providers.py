@@ -0,0 +1,252 @@
+import base64
+import math
+import os
+import random
+import threading
+import time
+
+import clients
+import metrics
+
+
+def _timeout(timeout):
+    """Per-request timeout option for the Groq and OpenAI SDKs, left out when unset"""
+    return {'timeout': timeout} if timeout else {}
+
+
+class GroqVision:
+    """LLAVA image descriptions through Groq"""
+
+    def describe(self, image_url, prompt, model, timeout=None):
+        chat_completion = clients.groq_client().chat.completions.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": image_url}},
+                    ],
+                }
+            ],
+            model=model,
+            **_timeout(timeout)
+        )
+        metrics.record_usage(model, chat_completion.usage)
+        return chat_completion.choices[0].message.content
+
+
+class OpenAIChat:
+    """GPT chat completions"""
+
+    def __init__(self, model="gpt-3.5-turbo", temperature=0.7, max_tokens=2000):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def complete(self, messages, timeout=None, **options):
+        """Return the reply text"""
+        response = clients.openai_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            **_timeout(timeout),
+            **options
+        )
+        metrics.record_usage(self.model, response.usage)
+        return response.choices[0].message.content
+
+    def stream(self, messages, timeout=None):
+        """Yield the reply text as it is generated"""
+        stream = clients.openai_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **_timeout(timeout)
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            # The final chunk carries token usage and no choices
+            metrics.record_usage(self.model, getattr(chunk, 'usage', None))
+
+
+class OpenAIImages:
+    """OpenAI image generation"""
+
+    def generate(self, prompt, size, n, model, timeout=None):
+        """Return the first generated image as base64 PNG"""
+        res = clients.openai_client().images.generate(
+            prompt=prompt,
+            model=model,
+            n=n,
+            size=size,
+            response_format="b64_json",
+            **_timeout(timeout)
+        )
+        return res.data[0].b64_json
+
+
+class ElevenLabsSpeech:
+    """Eleven Labs text to speech"""
+
+    def __init__(self, base_url=None, api_key=None):
+        self.base_url = base_url or os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+        self.api_key = api_key or os.getenv("ELEVENLABS_API_KEY")
+
+    def synthesize(self, text, voice_id, voice_settings, timeout=None):
+        """Return MP3 bytes for the text, read from the streaming endpoint"""
+        url = f"{self.base_url}/v1/text-to-speech/{voice_id}/stream"
+        payload = {"text": text, "voice_settings": voice_settings}
+        headers = {"xi-api-key": self.api_key, "Content-Type": "application/json"}
+        with clients.http_session().post(url, json=payload, headers=headers,
+                                         timeout=clients.timeout(timeout), stream=True) as response:
+            if response.status_code != 200:
+                import requests
+
+                # Keep the response on the error so callers can tell rate limits and outages apart
+                raise requests.HTTPError(response.text, response=response)
+            return response.content
+
+
+class LatencyModel:
+    """Seconds per call drawn from recorded samples, or from a log-normal fit of a median and p95
+
+    Draws come from a seeded generator so runs are repeatable; scale shrinks
+    or stretches every draw.
+    """
+
+    def __init__(self, median=1.0, p95=None, samples=None, scale=1.0, seed=0):
+        self.samples = samples
+        self.mu = math.log(median)
+        # 1.645 standard deviations separate the median and p95 of a normal
+        self.sigma = math.log((p95 or median) / median) / 1.645
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        with self.lock:
+            if self.samples:
+                value = self.random.choice(self.samples)
+            else:
+                value = self.random.lognormvariate(self.mu, self.sigma)
+        return value * self.scale
+
+    def wait(self, timeout=None):
+        """Sleep for one draw, or for timeout seconds and then raise TimeoutError if the draw is longer"""
+        delay = self.sample()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Call timed out after {timeout:.2f}s")
+        time.sleep(delay)
+
+
+# Per-call latency recorded from the live providers: (median, p95) in seconds
+RECORDED_LATENCY = {
+    'vision': (1.2, 2.6),
+    'chat': (6.0, 11.0),
+    'image': (8.0, 15.0),
+    'speech': (1.8, 4.0),
+}
+
+FAKE_STORY = (
+    "Paragraph: A small fox found a glowing stone by the river{take}.\n"
+    "Image Description: A cartoon fox holding a glowing stone beside a river{take}.\n\n"
+    "Paragraph: The stone showed the fox a path through the forest{take}.\n"
+    "Image Description: A bright trail of light winding between tall trees{take}.\n\n"
+    "Paragraph: At the end of the path, the fox found its family waiting{take}.\n"
+    "Image Description: A family of foxes greeting each other at sunset{take}."
+)
+# 1x1 transparent PNG
+FAKE_PNG = base64.b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360606060000000050001a5f645400000000049454e44ae426082'
+)).decode('ascii')
+
+
+class FakeVision:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def describe(self, image_url, prompt, model, timeout=None):
+        self.latency.wait(timeout)
+        return 'A cartoon fox sitting by a sparkling river.'
+
+
+class FakeChat:
+    """Returns a fixed three-paragraph story, numbered per call so caches do not hide the work"""
+
+    def __init__(self, latency, story=FAKE_STORY, first_token_fraction=0.1):
+        self.latency = latency
+        self.story = story
+        self.first_token_fraction = first_token_fraction
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _reply(self):
+        with self.lock:
+            self.calls += 1
+            return self.story.format(take=f' (take {self.calls})')
+
+    def complete(self, messages, timeout=None, **options):
+        self.latency.wait(timeout)
+        return self._reply()
+
+    def stream(self, messages, timeout=None):
+        total = self.latency.sample()
+        if timeout is not None and total * self.first_token_fraction > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Call timed out after {timeout:.2f}s")
+        reply = self._reply()
+        tokens = [reply[index:index + 4] for index in range(0, len(reply), 4)]
+        time.sleep(total * self.first_token_fraction)
+        per_token = total * (1 - self.first_token_fraction) / len(tokens)
+        for token in tokens:
+            yield token
+            time.sleep(per_token)
+
+
+class FakeImages:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate(self, prompt, size, n, model, timeout=None):
+        self.latency.wait(timeout)
+        return FAKE_PNG
+
+
+class FakeSpeech:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def synthesize(self, text, voice_id, voice_settings, timeout=None):
+        self.latency.wait(timeout)
+        # Roughly 1 KB of MP3 per 16 characters of narration
+        return b'ID3' + b'\0' * (64 * len(text))
+
+
+class Providers:
+    """The vision, chat, image and speech backends the app calls"""
+
+    def __init__(self, vision, chat, images, speech):
+        self.vision = vision
+        self.chat = chat
+        self.images = images
+        self.speech = speech
+
+
+def create_providers(kind='live', latency_scale=1.0, seed=0):
+    """Build live providers, or fakes that sleep for recorded latencies"""
+    if kind == 'live':
+        return Providers(GroqVision(), OpenAIChat(), OpenAIImages(), ElevenLabsSpeech())
+    if kind == 'fake':
+        def latency(stage, offset):
+            median, p95 = RECORDED_LATENCY[stage]
+            return LatencyModel(median, p95, scale=latency_scale, seed=seed + offset)
+        return Providers(FakeVision(latency('vision', 0)), FakeChat(latency('chat', 1)),
+                         FakeImages(latency('image', 2)), FakeSpeech(latency('speech', 3)))
+    raise ValueError(f'Unknown providers: {kind}')
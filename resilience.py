@@ -0,0 +1,243 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of its time budget"""
+
+
+class CircuitOpenError(RuntimeError):
+    """A provider keeps failing and calls to it are refused until it recovers"""
+
+
+@contextmanager
+def deadline(seconds):
+    """Share a time budget between the provider calls made inside the block
+
+    The budget lives in a context variable, so tasks submitted with
+    concurrency.submit carry it into their worker threads.
+    """
+    if not seconds:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None without one"""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def status_code(error):
+    code = getattr(error, 'status_code', None)
+    if code is None:
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return code
+
+
+def is_retryable(error):
+    """Errors without a status (timeouts, dropped connections) and transient statuses are retried"""
+    if isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    code = status_code(error)
+    return code is None or code in RETRYABLE_STATUS
+
+
+def retry_after(error):
+    """Seconds a rate limited provider asked us to wait, if it said"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Fail fast after `failures` consecutive provider faults
+
+    While open every call is refused; after reset_timeout seconds one trial
+    call is let through, and its outcome closes or reopens the circuit.
+    failures=0 disables the breaker.
+    """
+
+    def __init__(self, name, failures=5, reset_timeout=30.0):
+        self.name = name
+        self.threshold = failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self.opened >= self.reset_timeout else 'open'
+
+    def allow(self):
+        with self.lock:
+            if not self.threshold or self.opened is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened >= self.reset_timeout:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            if self.opened is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.threshold and (self.opened is not None or self.failures >= self.threshold):
+                if self.opened is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened = time.monotonic()
+
+
+class CallPolicy:
+    """Timeouts, jittered exponential retries, optional hedging and a circuit breaker for one provider
+
+    Calls get timeout=... added to their arguments: the per-call timeout,
+    cut down to whatever is left of the request deadline.
+    """
+
+    def __init__(self, name, timeout=60.0, retries=1, backoff=0.5, max_backoff=8.0,
+                 hedge_after=0, breaker=None, limiter=None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(name, failures=0)
+        self.limiter = limiter
+
+    def call(self, func, *args, **kwargs):
+        """Return func(*args, timeout=..., **kwargs), retrying provider faults within the deadline"""
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._admit()
+            try:
+                result = self._attempt(func, args, kwargs, timeout)
+            except Exception as e:
+                self._retry_or_raise(attempt, e)
+                continue
+            self._record(None)
+            return result
+
+    def stream(self, func, *args, **kwargs):
+        """Yield from func(*args, timeout=..., **kwargs), retrying only until the first item arrives"""
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._admit()
+            try:
+                items = iter(func(*args, timeout=timeout, **kwargs))
+                first = next(items)
+                break
+            except StopIteration:
+                self._record(None)
+                return
+            except Exception as e:
+                self._retry_or_raise(attempt, e)
+
+        # Once text has reached the client a failure can no longer be retried
+        error = None
+        try:
+            yield first
+            yield from items
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record(error)
+
+    def _admit(self):
+        """Return the timeout for the next attempt, or refuse it"""
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"Request deadline exceeded before calling {self.name}")
+        if not self.breaker.allow():
+            metrics.provider_rejections.inc(provider=self.name)
+            raise CircuitOpenError(f"{self.name} is unavailable, try again shortly")
+        if self.limiter:
+            self.limiter.acquire()
+        return self.timeout if left is None else min(self.timeout, left)
+
+    def _attempt(self, func, args, kwargs, timeout):
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return func(*args, timeout=timeout, **kwargs)
+        # Send a duplicate when the first call is slow and take whichever succeeds first;
+        # the loser runs on until its own timeout since HTTP calls cannot be cancelled
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            futures = [executor.submit(contextvars.copy_context().run, func, *args, timeout=timeout, **kwargs)]
+            done, _ = wait(futures, timeout=self.hedge_after)
+            if not done:
+                metrics.provider_hedges.inc(provider=self.name)
+                logger.info(f"Hedging {self.name} call still running after {self.hedge_after:.2f}s")
+                futures.append(executor.submit(contextvars.copy_context().run, func, *args,
+                                               timeout=timeout - self.hedge_after, **kwargs))
+            error = None
+            for future in as_completed(futures):
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            raise error
+        finally:
+            executor.shutdown(wait=False)
+
+    def _retry_or_raise(self, attempt, error):
+        """Sleep before the next attempt, or re-raise when the error is final"""
+        self._record(error)
+        if attempt > self.retries or not is_retryable(error):
+            raise error
+        # Full jitter keeps clients that failed together from retrying together
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        hint = retry_after(error)
+        if hint:
+            delay = max(delay, min(hint, self.max_backoff))
+        left = remaining()
+        if left is not None and delay >= left:
+            raise error
+        metrics.provider_retries.inc(provider=self.name)
+        logger.info(f"Retrying {self.name} in {delay:.2f}s after error: {str(error)}")
+        time.sleep(delay)
+
+    def _record(self, error):
+        # Only provider faults count against the breaker; a rejected request means it is up
+        if error is not None and is_retryable(error):
+            self.breaker.failure()
+        elif not isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+            self.breaker.success()
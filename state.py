@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class MemoryStateStore:
+    """In-process state with TTL eviction, for a single worker process"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.next_sweep = 0
+
+    def set(self, key, value):
+        with self.lock:
+            now = time.time()
+            self.entries[key] = (value, now + self.ttl)
+            # Sweep expired entries now and then so the dict cannot grow without bound
+            if now >= self.next_sweep:
+                self.next_sweep = now + 60
+                expired = [name for name, (_, expires) in self.entries.items() if expires <= now]
+                for name in expired:
+                    del self.entries[name]
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                self.entries.pop(key, None)
+                return None
+            return entry[0]
+
+
+class SQLiteStateStore:
+    """State in a SQLite file shared by every worker process on one host"""
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)',
+                         (key, json.dumps(value), now + self.ttl))
+            conn.execute('DELETE FROM state WHERE expires <= ?', (now,))
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM state WHERE key = ? AND expires > ?',
+                               (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class RedisStateStore:
+    """State in Redis (or a Redis-compatible server) shared across hosts"""
+
+    def __init__(self, url, ttl=3600, prefix='imagetales:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('The redis package is required for a redis:// STATE_STORE')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+
+def create_state_store(url, ttl=3600):
+    """Build a store from 'memory', 'sqlite:///path/to/file.db' or 'redis://host:port/db'"""
+    if not url or url == 'memory':
+        return MemoryStateStore(ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):], ttl)
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisStateStore(url, ttl)
+    raise ValueError(f'Unsupported state store: {url}')
+
+
+def new_id():
+    return uuid.uuid4().hex
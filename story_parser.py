@@ -0,0 +1,149 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Matches section headers such as "Paragraph:", "**Paragraph 2:**", "### Image Description 1 -"
+# or "Scene Description:", and captures any text after the header
+MARKER = re.compile(
+    r'^[\s#*_>\-\d.]*(?P<field>paragraph|image description|scene description|image prompt|illustration)'
+    r'\s*\d*[*_]*(?:\s*:|\s+[-–]\s)\s*[*_]*\s*(?P<text>.*)$',
+    re.IGNORECASE
+)
+FIELDS = {
+    'paragraph': 'paragraph',
+    'image description': 'description',
+    'scene description': 'description',
+    'image prompt': 'description',
+    'illustration': 'description',
+}
+
+
+class StoryStreamParser:
+    """Incrementally pair 'Paragraph:' and 'Image Description:' sections of a story
+
+    feed() accepts text as it arrives and returns the (paragraph, description)
+    pairs completed so far; close() flushes the last pair. A pair is complete
+    at the blank line after its second section, so it is emitted without
+    waiting for the next header. Each line is looked at once. Pairs are repaired as they are emitted: a paragraph without a
+    description is illustrated from its own text, and a description without a
+    paragraph is dropped. A reply with no section headers at all is split
+    into paragraphs on blank lines.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.field = None
+        self.paragraph = None
+        self.description = None
+        self.lines = []
+        self.seen_marker = False
+        self.unmarked = []
+
+    def feed(self, text):
+        lines = (self.buffer + text).split('\n')
+        # The last piece has no newline yet and may still grow
+        self.buffer = lines.pop()
+        pairs = []
+        for line in lines:
+            pairs.extend(self._line(line))
+        return pairs
+
+    def close(self):
+        pairs = []
+        if self.buffer:
+            pairs.extend(self._line(self.buffer))
+            self.buffer = ''
+        self._end_field()
+        if self.paragraph or self.description:
+            pairs.extend(self._pair())
+        if not self.seen_marker:
+            pairs.extend(self._unmarked_pairs())
+        return pairs
+
+    def _line(self, line):
+        stripped = line.strip()
+        match = MARKER.match(stripped)
+        if match:
+            field = FIELDS[match.group('field').lower()]
+            self._end_field()
+            self.seen_marker = True
+            pairs = []
+            # A repeated field starts the next pair
+            if getattr(self, field) is not None:
+                pairs.extend(self._pair())
+            self.field = field
+            self.lines = [match.group('text').strip(' *_')]
+            return pairs
+        if self.field:
+            other = 'description' if self.field == 'paragraph' else 'paragraph'
+            if not stripped and getattr(self, other) is not None:
+                self._end_field()
+                return self._pair()
+            self.lines.append(stripped)
+        elif not self.seen_marker:
+            self.unmarked.append(stripped)
+        return []
+
+    def _end_field(self):
+        if self.field:
+            setattr(self, self.field, ' '.join(line for line in self.lines if line))
+            self.field = None
+            self.lines = []
+
+    def _pair(self):
+        paragraph, description = self.paragraph, self.description
+        self.paragraph = None
+        self.description = None
+        return repair_pair(paragraph, description)
+
+    def _unmarked_pairs(self):
+        pairs = []
+        for block in '\n'.join(self.unmarked).split('\n\n'):
+            pairs.extend(repair_pair(' '.join(line for line in block.split('\n') if line), None))
+        return pairs
+
+
+def repair_pair(paragraph, description):
+    """Return [(paragraph, description)] with a missing description filled in, or [] to drop it"""
+    if not paragraph:
+        if description:
+            logger.info("Dropping image description without a paragraph")
+        return []
+    if not description:
+        description = paragraph
+    return [(paragraph, description)]
+
+
+def parse_story(text):
+    """Return the (paragraph, description) pairs of a complete story"""
+    parser = StoryStreamParser()
+    return parser.feed(text) + parser.close()
+
+
+def parse_story_json(text):
+    """Return the pairs of a structured-output story, falling back to the text format when it is not JSON
+
+    Expects {"story": [{"paragraph": ..., "image_description": ...}, ...]}.
+    Anything else yields no pairs, and items that are not objects are skipped.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        logger.info(f"Structured story was not valid JSON, parsing as text: {str(e)}")
+        return parse_story(text)
+    items = data.get('story') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        logger.info("Structured story has no story list")
+        return []
+    pairs = []
+    for item in items:
+        if not isinstance(item, dict):
+            logger.info("Skipping structured story item that is not an object")
+            continue
+        pairs.extend(repair_pair(
+            str(item.get('paragraph') or '').strip(),
+            str(item.get('image_description') or item.get('description') or '').strip()
+        ))
+    return pairs
@@ -3,7 +3,6 @@ from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import base64
 import os
-import re
 import requests
 from dotenv import load_dotenv
 from groq import Groq
@@ -13,6 +12,8 @@ from openai import OpenAI
 import argparse
 import pygame
 import io
+from story_parser import parse_story
+import metrics
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -153,32 +154,17 @@ def generate_visual_story():
         conversation = ChatGPT_conversation(conversation)
         ans = ('{0}: {1}\n'.format(conversation[-1]['role'].strip(), conversation[-1]['content'].strip()))
         raw_contents = conversation[1]["content"]
-        print("RAW: ",conversation)
-        print()
-
-        split_contents = re.split('\n|\n\n', raw_contents)
-        print("Contents: ", split_contents)
-        print()
-        # Create empty lists for image descriptions, paragraphs, and images
-        image_descriptions = []
-        paragraphs = []
+        # Dump the raw conversation only for a sampled share of requests
+        dump_payloads = metrics.debug_sampled()
+        if dump_payloads:
+            logger.info(f"Raw conversation: {conversation}")
+
+        # Extract the image descriptions and paragraphs in a single pass
+        pairs = parse_story(raw_contents)
+        image_descriptions = [description for _, description in pairs]
+        paragraphs = [paragraph for paragraph, _ in pairs]
         images = []
 
-        # Split the answer into lines
-        lines = ans.strip().split('\n')
-
-        for i, line in enumerate(split_contents):
-            if line==(""):
-                pass
-            # Check if the line is an image description
-            if "Image Description:" in line:
-                # Append the image description to the list
-                image_descriptions.append(line[len('Image Description:'):].strip())
-            # Check if the line is a paragraph
-            elif "Paragraph:" in line:
-                # Append the paragraph to the list
-                paragraphs.append(line[len('Paragraph:'):].strip())
-
         # Generate images 
         count = 1
         for index, description in enumerate(image_descriptions):
@@ -210,10 +196,10 @@ def generate_visual_story():
                 # Increment count
                 count += 1
                 
-        print("RAW: ", raw_contents)
-        print()
-        print("IMAGES: ", images)
-        print()
+        if dump_payloads:
+            # Log image sizes rather than the base64 data itself
+            logger.info(f"Raw story: {raw_contents}")
+            logger.info(f"Images: {[len(image['data']) for image in images]} base64 characters")
         
         story_text = '\n\n'.join(paragraphs)
         
@@ -0,0 +1,8 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+from app import create_app
+
+# Provider SDKs are imported by the first call that needs them. WARM_CLIENTS=true imports
+# them in the background instead, which helps when workers are up well before traffic arrives
+app = create_app(start_jobs=True, warm_clients=os.getenv("WARM_CLIENTS", "false") == "true")